@@ -0,0 +1,59 @@
+"""Compare pickled Responses against compact records for caching.
+
+Before responses were stored as records, the memcached client pickled
+whatever the view returned. This measures the cost of serialising
+("set") and deserialising ("get") a typical JSON response each way, and
+the number of bytes stored.
+
+Usage: python benchmarks/cache_records.py [items] [repeat]
+
+"""
+import sys
+import timeit
+import cPickle
+
+from nucleon.http import JsonResponse
+from nucleon.cache import encode_response, decode_response
+
+
+def make_response(count):
+    """Build a JSON response listing count items."""
+    return JsonResponse([
+        {'id': i, 'name': u'Item %d' % i, 'price': i * 1.25, 'tags': ['a', 'b']}
+        for i in xrange(count)
+    ])
+
+
+def measure(name, dump, load, resp, repeat):
+    stored = dump(resp)
+    set_cost = min(timeit.repeat(lambda: dump(resp), number=repeat, repeat=3))
+    get_cost = min(timeit.repeat(lambda: load(stored), number=repeat, repeat=3))
+    print "%-16s set %7.1fus  get %7.1fus  %8d bytes" % (
+        name,
+        set_cost / repeat * 1e6,
+        get_cost / repeat * 1e6,
+        len(stored),
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    resp = make_response(count)
+    measure(
+        'pickle',
+        lambda r: cPickle.dumps(r, cPickle.HIGHEST_PROTOCOL),
+        cPickle.loads,
+        resp, repeat
+    )
+    measure('record', encode_response, decode_response, resp, repeat)
+    measure(
+        'record+zlib',
+        lambda r: encode_response(r, compress=True),
+        decode_response,
+        resp, repeat
+    )
+
+
+if __name__ == '__main__':
+    main()
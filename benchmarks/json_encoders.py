@@ -0,0 +1,60 @@
+"""Compare the speed of the available JSON encoders.
+
+Each encoder serialises data shaped like Results.rows - a list of
+OrderedDicts including dates and times, as retrieved from the database.
+
+Usage: python benchmarks/json_encoders.py [rows] [repeat]
+
+"""
+import sys
+import json
+import timeit
+import datetime
+
+from nucleon.database.api import Results
+from nucleon.json_encoders import (
+    ENCODERS, load_encoder, serialize_date_to_json
+)
+
+
+def make_rows(count):
+    """Build a list of rows like those returned by a select query."""
+    description = [(name,) for name in (
+        'id', 'name', 'email', 'balance', 'active', 'created', 'birthday'
+    )]
+    created = datetime.datetime(2012, 2, 21, 11, 57, 11, 451137)
+    rows = [
+        (
+            i,
+            u'User %d' % i,
+            'user%d@example.com' % i,
+            i * 1.5,
+            i % 2 == 0,
+            created + datetime.timedelta(seconds=i),
+            datetime.date(1980, 1, 1) + datetime.timedelta(days=i),
+        ) for i in xrange(count)
+    ]
+    return Results(description, rows).rows
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rows = make_rows(count)
+    encoders = [(name, load_encoder(name)) for name in sorted(ENCODERS)]
+    # The behaviour before encoders were pluggable, for comparison
+    encoders.append(
+        ('json.dumps', lambda o: json.dumps(o, default=serialize_date_to_json))
+    )
+
+    print "Encoding %d rows, best of %d runs" % (count, repeat)
+    for name, encode in encoders:
+        size = len(encode(rows))
+        best = min(timeit.repeat(lambda: encode(rows), number=1, repeat=repeat))
+        print "%-12s %8.2fms %10d bytes %10.0f rows/s" % (
+            name, best * 1000, size, count / best
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Compare requests/sec of ordinary views against raw views.
+
+Each view is called through the application's WSGI interface, without a
+server, so that the figures reflect the overhead of nucleon itself.
+
+Usage: python benchmarks/raw_views.py [requests]
+
+"""
+import sys
+import time
+from StringIO import StringIO
+
+from nucleon.framework import Application
+
+
+def health(request):
+    return {'status': 'ok'}
+
+
+def make_app():
+    app = Application()
+    app.add_view('/health', health)
+    app.add_view('/raw/health', health, raw=True)
+    return app
+
+
+def make_environ(path):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'HTTP_USER_AGENT': 'benchmark',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': StringIO(''),
+        'wsgi.errors': sys.stderr,
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': False,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def run(app, path, count):
+    """Serve count requests for path, returning requests per second."""
+    start = time.time()
+    for i in xrange(count):
+        body = ''.join(app(make_environ(path), start_response))
+    return count / (time.time() - start)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    app = make_app()
+    for name, path in [('webob', '/health'), ('raw', '/raw/health')]:
+        run(app, path, 100)  # warm up
+        print "%-6s %10.0f requests/s" % (name, run(app, path, count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""An endpoint that serves several requests at once.
+
+Clients that need many small resources can POST a JSON list of
+sub-requests to a batch view, which dispatches them concurrently within the
+application and returns a JSON list of their responses. Each sub-request is
+either a path, or an object giving a path and optionally a method, headers
+and a JSON body::
+
+    ["/users/1", {"method": "POST", "path": "/search", "body": {"q": "x"}}]
+
+The response is a list with a status and body for each sub-request, in the
+same order::
+
+    [{"status": 200, "body": {...}}, {"status": 404, "body": {...}}]
+
+JSON bodies are included as they are; other bodies are included as strings.
+
+"""
+
+import sys
+import json
+import traceback
+
+from webob import Request, Response
+
+from .http import HttpException, JsonErrorResponse
+from .json_encoders import get_encoder
+from .parallel import parallel
+
+
+__all__ = ['BatchView']
+
+# Environ keys of a batch request that are passed on to its sub-requests,
+# besides the HTTP headers
+INHERITED_ENVIRON = (
+    'REMOTE_ADDR', 'SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL',
+    'SCRIPT_NAME', 'wsgi.url_scheme',
+)
+
+# Headers that describe the batch request's own body
+EXCLUDED_HEADERS = ('HTTP_CONTENT_LENGTH', 'HTTP_CONTENT_TYPE')
+
+JSON_TYPES = ('application/json',)
+
+
+def batch_error(message):
+    """Build a 400 response for an invalid batch request."""
+    return JsonErrorResponse({
+        'error': 'INVALID_BATCH',
+        'message': message
+    })
+
+
+class BatchView(object):
+    """A view that dispatches a list of sub-requests through an application.
+
+    At most concurrency sub-requests are served at once, and a batch may
+    contain at most max_requests sub-requests.
+
+    """
+    def __init__(self, app, concurrency=8, max_requests=50):
+        self.app = app
+        self.concurrency = concurrency
+        self.max_requests = max_requests
+
+    def __call__(self, request):
+        if request.environ.get('nucleon.batch'):
+            return batch_error("Batch requests cannot be nested")
+        try:
+            subrequests = json.loads(request.body)
+        except ValueError:
+            return batch_error("The request body is not valid JSON")
+        if not isinstance(subrequests, list):
+            return batch_error("The request body must be a list")
+        if len(subrequests) > self.max_requests:
+            return batch_error(
+                "A batch may contain at most %d requests" % self.max_requests
+            )
+
+        inherited = dict(
+            (k, v) for k, v in request.environ.items()
+            if (k.startswith('HTTP_') and k not in EXCLUDED_HEADERS) or
+                k in INHERITED_ENVIRON
+        )
+        inherited['nucleon.batch'] = True
+        try:
+            subrequests = [self.make_request(s, inherited) for s in subrequests]
+        except (TypeError, ValueError) as e:
+            return batch_error(str(e))
+
+        results = parallel(
+            *[lambda r=r: self.serve(r) for r in subrequests],
+            limit=self.concurrency
+        )
+        body = '[%s]' % ','.join(results)
+        return Response(body, content_type='application/json')
+
+    def make_request(self, spec, inherited):
+        """Build a Request for a sub-request given in a batch."""
+        if isinstance(spec, basestring):
+            spec = {'path': spec}
+        elif not isinstance(spec, dict):
+            raise TypeError("Each request must be a path or an object")
+        try:
+            path = str(spec['path'])
+        except KeyError:
+            raise ValueError("Each request must have a path")
+        if not path.startswith('/'):
+            raise ValueError("Invalid path %r" % path)
+        method = str(spec.get('method', 'GET')).upper()
+        headers = spec.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise TypeError("The headers of a request must be an object")
+        sub = Request.blank(path, environ=dict(inherited), method=method)
+        for name, value in headers.items():
+            sub.headers[str(name)] = str(value)
+        if 'body' in spec:
+            sub.body = get_encoder()(spec['body'])
+            sub.content_type = 'application/json'
+        return sub
+
+    def serve(self, request):
+        """Serve a sub-request, returning its result serialised as JSON.
+
+        Each sub-request is counted as a request in progress while it is
+        served, so it is refused with a 503 if it would exceed the
+        application's max_active_requests or adaptive limit.
+
+        """
+        with self.app.active_requests_counter:
+            try:
+                resp = self.app._dispatch(request)
+            except HttpException, e:
+                resp = e.response(request)
+            except:
+                tb = traceback.format_exc()
+                print >>sys.stderr, tb
+                resp = Response(tb, status=500, content_type='text/plain')
+            # Streamed bodies are produced as they are read
+            body = resp.body
+
+        if resp.content_type not in JSON_TYPES or not body:
+            body = get_encoder()(body.decode(resp.charset or 'utf8', 'replace'))
+        return '{"status":%d,"body":%s}' % (resp.status_int, body)
@@ -1,44 +1,682 @@
-"""Memcached support"""
+"""Memcached support
 
-from geventmemcache import Memcache
+Values are stored in memcached, and may also be kept for a short time in an
+in-process cache in each worker, so that hot keys are served without a
+round-trip to memcached. The in-process cache is bounded by the total size
+of the values it holds, and discards the least recently used values first.
+
+When a cached value is missing, only one greenlet in each worker computes
+it; others that want the same value wait for its result. Optionally, a lock
+in memcached extends this across workers and hosts.
+
+Cached values may be tagged, and invalidated by tag: each tag has a
+generation counter in memcached, which forms part of the keys of the values
+tagged with it. Incrementing the counter makes those values unreachable.
+
+Responses cached by the cached decorator are stored as compact byte records
+of their status, headers and body (see encode_response()), rather than as
+pickled Response objects.
+
+"""
+
+import math
+import time
+import zlib
+import struct
+import pickle
+import random
+import logging
 from functools import wraps
 
+import gevent
+from gevent.event import AsyncResult
+from webob import Response
 
-# List of servers to use
-SERVERS = [
-    # ((ip, port), weight)
-    (('127.0.0.1', 11211), 1)
+from .framework import make_response
+from .memcached import MemcacheClient
+
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+
+__all__ = [
+    'cache', 'cached', 'fetch', 'fetch_many', 'get_many', 'set_many', 'stats',
+    'invalidate', 'tagged_key'
 ]
 
-cache = Memcache(SERVERS)
+logger = logging.getLogger(__name__)
+
+# Default budget of the in-process cache, in bytes
+LOCAL_CACHE_BYTES = 32 * 1024 * 1024
+
+# Prefix of the keys of locks held while computing a value
+LOCK_PREFIX = 'lock:'
+
+# Interval at which to check for a value while another process computes it
+LOCK_POLL_INTERVAL = 0.05
+
+
+# Prefix of the keys of tag generation counters
+GENERATION_PREFIX = 'gen:'
+
+# Version of the format of cached response records
+RECORD_VERSION = 1
+
+# Record flags
+RECORD_COMPRESSED = 0x1
+
+# Version, flags, status, length of headers
+RECORD_HEADER = struct.Struct('!BBHI')
+
+# Bodies smaller than this are not compressed
+RECORD_COMPRESS_MIN_SIZE = 1024
+
+# Headers that are not stored with cached responses
+UNCACHED_HEADERS = frozenset([
+    'content-length', 'date', 'set-cookie', 'connection', 'transfer-encoding'
+])
+
+# Time at which a value becomes stale, and time taken to compute it
+ENVELOPE = struct.Struct('!dd')
+
+
+def encode_response(resp, compress=False):
+    """Serialise a Response as a compact record.
+
+    The record holds the status, headers and body of the response, except
+    for UNCACHED_HEADERS. If compress is True, bodies of at least
+    RECORD_COMPRESS_MIN_SIZE bytes are compressed with zlib.
+
+    """
+    flags = 0
+    body = resp.body
+    if compress and len(body) >= RECORD_COMPRESS_MIN_SIZE:
+        body = zlib.compress(body)
+        flags |= RECORD_COMPRESSED
+    headers = '\r\n'.join(
+        '%s: %s' % (k, v) for k, v in resp.headerlist
+        if k.lower() not in UNCACHED_HEADERS
+    )
+    return ''.join([
+        RECORD_HEADER.pack(
+            RECORD_VERSION, flags, resp.status_int, len(headers)
+        ),
+        headers, body
+    ])
+
+
+def decode_response(record):
+    """Build a Response from a record made by encode_response().
+
+    Returns None if the record is in an unknown format.
+
+    """
+    try:
+        version, flags, status, length = RECORD_HEADER.unpack_from(record)
+    except struct.error:
+        return None
+    if version != RECORD_VERSION:
+        return None
+    start = RECORD_HEADER.size
+    headers = record[start:start + length]
+    body = record[start + length:]
+    if flags & RECORD_COMPRESSED:
+        body = zlib.decompress(body)
+    headerlist = [tuple(h.split(': ', 1)) for h in headers.split('\r\n') if h]
+    return Response(status=status, headerlist=headerlist, body=body)
+
+
+def copy_value(value):
+    """Copy a cached value if it may be modified as it is served."""
+    if isinstance(value, Response):
+        return value.copy()
+    return value
+
+
+def sizeof(value):
+    """Estimate the memory used by a cached value, in bytes."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, Response):
+        return len(value.body) + sum(
+            len(k) + len(v) for k, v in value.headerlist
+        )
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return 1024
+
+
+class LocalCache(object):
+    """An in-process LRU cache with a budget in bytes.
+
+    Each value is stored with its own time-to-live.
+
+    """
+    def __init__(self, max_bytes=LOCAL_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (expires, size, value)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the value stored for key, or None if absent or expired."""
+        try:
+            expires, size, value = self.entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return None
+        if expires < time.time():
+            self.bytes -= size
+            self.misses += 1
+            return None
+        self.entries[key] = expires, size, value
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        """Store value for ttl seconds, evicting old values to make room."""
+        self.delete(key)
+        size = sizeof(value)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = time.time() + ttl, size, value
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            k, (expires, size, v) = self.entries.popitem(last=False)
+            self.bytes -= size
+
+    def delete(self, key):
+        """Discard any value stored for key."""
+        try:
+            expires, size, value = self.entries.pop(key)
+        except KeyError:
+            return
+        self.bytes -= size
+
+    def clear(self):
+        """Discard all values."""
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+        }
+
+
+class TieredCache(object):
+    """A memcached client with an optional in-process cache in front of it.
+
+    Values are only kept in the in-process cache if local_ttl is given when
+    they are stored. This should be short, as values in the in-process cache
+    of each worker are not discarded when they change in memcached.
+
+    If remote is not given, a client for the servers configured in settings
+    is created when it is first needed (see nucleon.memcached).
+
+    """
+    def __init__(self, remote=None, local=None):
+        self._remote = remote
+        self.local = local if local is not None else LocalCache()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def remote(self):
+        if self._remote is None:
+            self._remote = MemcacheClient.from_settings()
+        return self._remote
+
+    def get(self, key, local_ttl=None):
+        """Return the value stored for key, or None.
+
+        The in-process cache is only consulted if local_ttl is given, in
+        which case values fetched from memcached are also kept in the
+        in-process cache for that many seconds.
+
+        """
+        if local_ttl:
+            value = self.local.get(key)
+            if value is not None:
+                # Responses may be modified as they are served
+                return copy_value(value)
+        value = self.remote.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if local_ttl:
+            self._set_local(key, value, local_ttl)
+        return value
+
+    def get_many(self, keys, local_ttl=None):
+        """Return a dictionary of the values stored for keys.
+
+        Keys that are not stored are omitted. Keys not found in the
+        in-process cache are fetched from memcached with one round-trip per
+        server. local_ttl is as for get().
+
+        """
+        values = {}
+        missing = keys
+        if local_ttl:
+            missing = []
+            for key in keys:
+                value = self.local.get(key)
+                if value is None:
+                    missing.append(key)
+                else:
+                    values[key] = copy_value(value)
+        if not missing:
+            return values
+        found = self.remote.get_many(missing)
+        self.hits += len(found)
+        self.misses += len(missing) - len(found)
+        if local_ttl:
+            for key, value in found.items():
+                self._set_local(key, value, local_ttl)
+        values.update(found)
+        return values
+
+    def set(self, key, value, expiry=0, local_ttl=None):
+        """Store value in memcached for expiry seconds.
+
+        If local_ttl is given, the value is also kept in the in-process cache
+        for that many seconds.
+
+        """
+        if local_ttl:
+            self._set_local(key, value, local_ttl)
+        else:
+            self.local.delete(key)
+        return self.remote.set(key, value, expiry)
+
+    def set_many(self, mapping, expiry=0, local_ttl=None):
+        """Store a dictionary of values in memcached for expiry seconds.
+
+        Returns a list of the keys that were not stored. local_ttl is as for
+        set().
+
+        """
+        for key, value in mapping.items():
+            if local_ttl:
+                self._set_local(key, value, local_ttl)
+            else:
+                self.local.delete(key)
+        return self.remote.set_many(mapping, expiry)
+
+    def _set_local(self, key, value, ttl):
+        """Keep a value in the in-process cache."""
+        self.local.set(key, copy_value(value), ttl)
+
+    def add(self, key, value, expiry=0):
+        """Store value in memcached only if key is not already stored.
+
+        Returns True if the value was stored, False if key is already
+        stored, or None if memcached could not be reached.
+
+        """
+        return self.remote.add(key, value, expiry)
+
+    def delete(self, key):
+        """Discard the value stored for key."""
+        self.local.delete(key)
+        return self.remote.delete(key)
+
+    def stats(self):
+        """Return the hit and miss counts of each tier."""
+        return {
+            'local': self.local.stats(),
+            'memcached': {'hits': self.hits, 'misses': self.misses},
+        }
+
+
+cache = TieredCache()
+
+
+def stats():
+    """Return the hit and miss counts of each tier of the cache."""
+    return cache.stats()
+
+
+def get_many(keys, local_ttl=None):
+    """Return a dictionary of the values cached for keys.
+
+    See TieredCache.get_many().
+
+    """
+    return cache.get_many(keys, local_ttl=local_ttl)
+
+
+def set_many(mapping, expiry=0, local_ttl=None):
+    """Cache a dictionary of values, returning the keys not stored.
+
+    See TieredCache.set_many().
+
+    """
+    return cache.set_many(mapping, expiry, local_ttl=local_ttl)
+
+
+def fetch_many(ids, load, cache_key=str, expiry=600, local_ttl=None):
+    """Return a dictionary of the values for ids, loading any not cached.
+
+    cache_key is called with each id and returns its cache key. The values
+    of ids that are not cached are loaded with a single call to load(),
+    which is given a list of the missing ids and returns a dictionary of
+    their values; these are then stored in the cache. Ids that load() does
+    not return are omitted from the result, and are not cached.
+
+    Unlike fetch(), concurrent misses are not coalesced.
+
+    """
+    keys = dict((id, cache_key(id)) for id in ids)
+    found = cache.get_many(keys.values(), local_ttl=local_ttl)
+    values = {}
+    missing = []
+    for id, key in keys.items():
+        if key in found:
+            values[id] = found[key]
+        else:
+            missing.append(id)
+    if missing:
+        loaded = load(missing)
+        cache.set_many(
+            dict((keys[id], value) for id, value in loaded.items()),
+            expiry, local_ttl=local_ttl
+        )
+        values.update(loaded)
+    return values
+
+
+def generations(tags):
+    """Return the current generation of each of tags, as a list.
+
+    Generations are fetched from memcached with one round-trip per server.
+    Tags without a generation, because they are new or their counter has
+    been evicted, are given one based on the current time in microseconds,
+    so that it is greater than any generation the tag had before.
+
+    """
+    keys = [GENERATION_PREFIX + tag for tag in tags]
+    found = cache.remote.get_many(keys)
+    result = []
+    for key in keys:
+        generation = found.get(key)
+        if generation is None:
+            generation = int(time.time() * 1000000)
+            if not cache.remote.add(key, generation):
+                # Another process created it first
+                generation = cache.remote.get(key) or generation
+        result.append(generation)
+    return result
+
+
+def tagged_key(key, tags):
+    """Return the key under which to store a value with the given tags.
+
+    The key includes the current generation of each tag, so it changes when
+    any of the tags is invalidated.
+
+    """
+    if not tags:
+        return key
+    return '%s#%s' % (key, '.'.join(str(g) for g in generations(tags)))
+
+
+def invalidate(tag):
+    """Invalidate every value cached with tag, in every process.
+
+    This increments the tag's generation, so that the values are no longer
+    found; they are left in memcached until they expire or are evicted.
+
+    """
+    cache.remote.incr(GENERATION_PREFIX + tag)
 
 
 def get_cache_key(request, *args, **kwargs):
     return request.path_qs
 
 
-def cached(expiry=600, cache_key=get_cache_key):
-    if callable(cache_key):
-        def decorator(view):
-            @wraps(view)
-            def wrapped(request, *args, **kwargs):
-                key = cache_key(request, *args, **kwargs)
-                resp = cache.get(key)
-                if resp is not None:
-                    return resp
-                resp = view(request, *args, **kwargs)
-                cache.set(key, resp, expiry)
-                return resp
-            return wrapped
+# Values being computed in this worker, by key
+_flights = {}
+
+# Result of a background refresh that gave way to another process
+_GAVE_WAY = object()
+
+
+def fetch(key, compute, expiry=600, local_ttl=None, lock_timeout=None,
+        stale=None, early_refresh=None):
+    """Return the value cached for key, calling compute() if it is missing.
+
+    Concurrent calls for the same key in this worker are coalesced: one
+    calls compute() and the others wait for its result, or its exception.
+
+    If lock_timeout is given, a lock is taken in memcached while computing
+    the value, so that other workers wait for it to be stored rather than
+    computing it too. They wait at most lock_timeout seconds, after which
+    they compute the value themselves.
+
+    If stale is given, values are kept for that many seconds after they
+    expire. During that time the stale value is returned immediately, and
+    compute() is called in a background greenlet to refresh it. If
+    early_refresh is given, values may also be refreshed before they
+    expire, with a probability that rises as expiry approaches and with the
+    time compute() takes; 1.0 is a reasonable value, and larger values
+    refresh earlier.
+
+    """
+    policy = (expiry, local_ttl, lock_timeout, stale, early_refresh)
+    entry = _lookup(key, local_ttl, stale or early_refresh)
+    if entry is not None:
+        value, soft_expires, delta = entry
+        if soft_expires is not None and \
+                _should_refresh(soft_expires, delta, early_refresh):
+            _refresh_later(key, compute, policy)
+        return value
+
+    while True:
+        flight = _flights.get(key)
+        if flight is None:
+            break
+        value = flight.get()
+        if value is not _GAVE_WAY:
+            return copy_value(value)
+        # A background refresh gave way to another process; wait for any
+        # other flight, or compute it here
+
+    flight = _flights[key] = AsyncResult()
+    try:
+        value = _compute(key, compute, policy, wait=True)
+    except Exception as e:
+        flight.set_exception(e)
+        raise
     else:
-        def decorator(view):
-            @wraps(view)
-            def wrapped(request, *args, **kwargs):
-                resp = cache.get(cache_key)
-                if resp is not None:
-                    return resp
-                resp = view(request, *args, **kwargs)
-                cache.set(cache_key, resp, expiry)
-                return resp
-            return wrapped
+        flight.set(copy_value(value))
+    finally:
+        _land(key, flight)
+    return value
+
+
+def _land(key, flight):
+    """Remove flight from _flights, if it is still the flight for key."""
+    if _flights.get(key) is flight:
+        del _flights[key]
+
+
+def _lookup(key, local_ttl, envelope):
+    """Return (value, soft_expires, delta) for key, or None if missing.
+
+    If envelope is True, the value is expected to have been stored with the
+    time at which it becomes stale, and the time taken to compute it;
+    otherwise soft_expires and delta are None.
+
+    """
+    entry = cache.get(key, local_ttl=local_ttl)
+    if entry is None:
+        return None
+    if not envelope:
+        return entry, None, None
+    if isinstance(entry, str) and len(entry) >= ENVELOPE.size:
+        soft_expires, delta = ENVELOPE.unpack_from(entry)
+        return entry[ENVELOPE.size:], soft_expires, delta
+    if isinstance(entry, tuple) and len(entry) == 3:
+        return entry
+    # Stored by a different policy
+    return None
+
+
+def _should_refresh(soft_expires, delta, early_refresh):
+    """Return True if a value should be refreshed now."""
+    now = time.time()
+    if early_refresh:
+        # Probabilistic early expiration ("XFetch")
+        now -= delta * early_refresh * math.log(1 - random.random())
+    return now >= soft_expires
+
+
+def _refresh_later(key, compute, policy):
+    """Refresh a value in a background greenlet, unless already refreshing."""
+    if key in _flights:
+        return
+    flight = _flights[key] = AsyncResult()
+
+    def refresh():
+        try:
+            value = _compute(key, compute, policy, wait=False)
+        except Exception as e:
+            flight.set_exception(e)
+            logger.exception("Error refreshing cached value for %r", key)
+        else:
+            flight.set(copy_value(value))
+        finally:
+            _land(key, flight)
+    gevent.spawn(refresh)
+
+
+def _compute(key, compute, policy, wait):
+    """Compute and store a value, holding a lock in memcached if required.
+
+    If the lock is held elsewhere and wait is True, wait for the value to be
+    stored. If wait is False, return _GAVE_WAY without computing the value.
+
+    """
+    expiry, local_ttl, lock_timeout, stale, early_refresh = policy
+    envelope = stale or early_refresh
+    lock_key = None
+    if lock_timeout:
+        lock_key = LOCK_PREFIX + key
+        give_up = time.time() + lock_timeout
+        lock_expiry = int(math.ceil(lock_timeout))
+        while True:
+            locked = cache.add(lock_key, 1, lock_expiry)
+            if locked:
+                break
+            if locked is None:
+                # memcached cannot be reached; don't wait for it
+                lock_key = None
+                break
+            if not wait:
+                return _GAVE_WAY
+            gevent.sleep(LOCK_POLL_INTERVAL)
+            entry = _lookup(key, local_ttl, envelope)
+            if entry is not None:
+                return entry[0]
+            if time.time() >= give_up:
+                lock_key = None
+                break
+    try:
+        start = time.time()
+        value = compute()
+        if envelope:
+            delta = time.time() - start
+            if isinstance(value, str):
+                # Strings, such as response records, are stored unpickled
+                entry = ENVELOPE.pack(time.time() + expiry, delta) + value
+            else:
+                entry = (value, time.time() + expiry, delta)
+            hard_expiry = expiry + (stale or 0)
+        else:
+            entry = value
+            hard_expiry = expiry
+        cache.set(key, entry, hard_expiry, local_ttl=local_ttl)
+    finally:
+        if lock_key is not None:
+            cache.remote.delete(lock_key)
+    return value
+
+
+def cached(expiry=600, cache_key=get_cache_key, local_ttl=None,
+        lock_timeout=None, stale=None, early_refresh=None, compress=False,
+        tags=None):
+    """Decorator that caches the responses of a view.
+
+    cache_key is either a constant key, or a function that is called with
+    the view's arguments and returns the key; by default, the request's path
+    and query string are used.
+
+    If local_ttl is given, responses are also kept in each worker's
+    in-process cache for that many seconds, or expiry if that is shorter.
+
+    Only one request in each worker calls the view when a response is
+    missing; if lock_timeout is given, a lock in memcached also prevents
+    other workers from calling it, for up to that many seconds.
+
+    If stale is given, expired responses are served for up to that many
+    seconds longer while the view is called in the background to refresh
+    them; early_refresh allows responses to be refreshed in the background
+    shortly before they expire. See fetch().
+
+    Responses are stored as records made by encode_response(); if compress
+    is True, large bodies are compressed.
+
+    tags is either a constant list of tags, or a function that is called
+    with the view's arguments and returns a list of tags. Responses are
+    invalidated when any of their tags is passed to invalidate(). Looking
+    up the tags' generations costs a round-trip to memcached on each
+    request, even if the response is in the in-process cache.
+
+    """
+    if local_ttl is not None and expiry:
+        local_ttl = min(local_ttl, expiry)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if callable(cache_key):
+                key = cache_key(request, *args, **kwargs)
+            else:
+                key = cache_key
+            if tags:
+                if callable(tags):
+                    key = tagged_key(key, tags(request, *args, **kwargs))
+                else:
+                    key = tagged_key(key, tags)
+
+            def compute():
+                resp = make_response(view(request, *args, **kwargs))
+                return encode_response(resp, compress)
+
+            record = fetch(
+                key, compute,
+                expiry, local_ttl=local_ttl, lock_timeout=lock_timeout,
+                stale=stale, early_refresh=early_refresh
+            )
+            if not isinstance(record, str):
+                # Stored by an earlier version of nucleon
+                return copy_value(record)
+            resp = decode_response(record)
+            if resp is None:
+                return view(request, *args, **kwargs)
+            return resp
+        return wrapped
     return decorator
@@ -23,6 +23,8 @@ class Command(object):
         'processes': 4,
         'no_daemonise': False,
         'pidfile': None,
+        'backlog': None,
+        'reuse_port': False,
     }
 
     def __call__(self, namespace):
@@ -140,9 +142,18 @@ class StartCommand(AppCommand):
         parser.add_argument('--no_daemonise',
             default=self.DEFAULTS['no_daemonise'], action="store_true",
             help="do not daemonise the nucleon app (default: %(default)s)")
+        parser.add_argument('--backlog', type=int,
+            default=self.DEFAULTS['backlog'],
+            help='length of the queue of connections waiting to be accepted'
+                ' (default: the listen_backlog setting, or 1024)')
+        parser.add_argument('--reuse_port',
+            default=self.DEFAULTS['reuse_port'], action="store_true",
+            help="give each server process its own listening socket, with"
+                " SO_REUSEPORT (default: the reuse_port setting)")
 
     def __call__(self, args=None):
-        from nucleon.main import serve
+        from nucleon.main import serve, DEFAULT_BACKLOG
+        from nucleon.config import settings
         def param(name):
             """Get an argument if passed or else get it from defaults"""
             if args and hasattr(args, name):
@@ -163,10 +174,21 @@ class StartCommand(AppCommand):
 
         app = self.get_app(args)
 
+        # Options not given on the command line may be set in settings
+        backlog = param('backlog')
+        if backlog is None:
+            backlog = int(getattr(settings, 'listen_backlog', DEFAULT_BACKLOG))
+        reuse_port = param('reuse_port')
+        if not reuse_port:
+            reuse_port = str(getattr(settings, 'reuse_port', '')).lower() in (
+                '1', 'true', 'yes', 'on'
+            )
+
         # Start the nucleon app with teh specified parameters
         serve(app, access_log=access_log, error_log=error_log,
             host=host, port=port, user=user, group=group,
-            no_daemonise=no_daemonise, pidfile=pidfile, processes=processes)
+            no_daemonise=no_daemonise, pidfile=pidfile, processes=processes,
+            backlog=backlog, reuse_port=reuse_port)
 
 
 class SyncdbCommand(AppCommand):
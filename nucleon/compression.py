@@ -0,0 +1,168 @@
+"""Compression of response bodies, negotiated with Accept-Encoding.
+
+Responses are compressed with gzip or deflate if the client accepts either,
+the content type is one that benefits from compression, and the body is at
+least a minimum size. Streamed responses, whose size is not known in advance,
+are compressed incrementally as they are sent.
+
+"""
+
+import zlib
+
+
+__all__ = ['compress_response']
+
+# Content encodings that can be produced, in order of preference
+ENCODINGS = ('gzip', 'deflate')
+
+# Content types, or prefixes of content types, that are worth compressing
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+)
+
+COMPRESS_LEVEL = 6
+
+
+def accepted_encoding(request):
+    """Return the preferred encoding in ENCODINGS that request accepts.
+
+    Returns None if the client accepts none of them.
+
+    """
+    header = request.headers.get('Accept-Encoding')
+    if not header:
+        return None
+    qualities = {}
+    for part in header.split(','):
+        params = part.split(';')
+        coding = params[0].strip().lower()
+        quality = 1.0
+        for param in params[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+
+    best = None
+    best_quality = 0
+    for encoding in ENCODINGS:
+        quality = qualities.get(encoding, qualities.get('*', 0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compressor(encoding):
+    """Return a zlib compression object producing the given encoding."""
+    if encoding == 'gzip':
+        wbits = zlib.MAX_WBITS | 16
+    else:
+        wbits = zlib.MAX_WBITS
+    return zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, wbits)
+
+
+def compress(body, encoding):
+    """Compress a complete body with the given encoding."""
+    c = compressor(encoding)
+    return c.compress(body) + c.flush()
+
+
+class CompressedIterable(object):
+    """Compresses a WSGI app_iter as it is iterated.
+
+    The compressor is flushed after each chunk so that the client receives
+    data as soon as it is produced.
+
+    """
+    def __init__(self, iterable, encoding):
+        self.iterable = iterable
+        self.encoding = encoding
+
+    def __iter__(self):
+        c = compressor(self.encoding)
+        for chunk in self.iterable:
+            data = c.compress(chunk) + c.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield c.flush()
+
+    def close(self):
+        close = getattr(self.iterable, 'close', None)
+        if close is not None:
+            close()
+
+
+def is_compressible(resp):
+    """Return True if resp is a type of response that should be compressed."""
+    if resp.status_int < 200 or resp.status_int in (204, 304):
+        return False
+    if resp.content_encoding:
+        return False
+    content_type = resp.content_type or ''
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def vary_response(request, resp):
+    """Give resp the headers of a response negotiated with Accept-Encoding.
+
+    Accept-Encoding is added to the Vary header and, if the client accepts
+    an encoding, the ETag is made weak: a compressed body differs
+    byte-for-byte, so a strong ETag no longer applies, but a weak ETag still
+    allows conditional requests to match. Returns the accepted encoding, or
+    None.
+
+    """
+    vary = resp.vary or ()
+    if 'Accept-Encoding' not in vary:
+        resp.vary = tuple(vary) + ('Accept-Encoding',)
+
+    encoding = accepted_encoding(request)
+    if encoding is not None:
+        etag = resp.headers.get('ETag')
+        if etag and not etag.startswith('W/'):
+            resp.headers['ETag'] = 'W/' + etag
+    return encoding
+
+
+def negotiate(request, resp, min_size):
+    """Set the headers resp will be sent with if it is compressed.
+
+    Returns the encoding to compress resp with, or None if it is to be sent
+    as it is. The body is not changed, so this can also be used to find the
+    headers of a response that is answered with 304 Not Modified.
+
+    """
+    if not is_compressible(resp):
+        return None
+    length = resp.content_length
+    if length is not None and length < min_size:
+        return None
+    return vary_response(request, resp)
+
+
+def compress_response(request, resp, min_size):
+    """Compress resp according to the encodings request accepts.
+
+    Bodies smaller than min_size bytes are not compressed. Responses whose
+    length is unknown, such as streamed responses, are compressed
+    incrementally. HEAD responses are given the same headers as GET, so
+    their bodies are compressed too, to find the Content-Length. Returns the
+    response, which is modified in place.
+
+    """
+    encoding = negotiate(request, resp, min_size)
+    if encoding is None:
+        return resp
+    if resp.content_length is None:
+        resp.app_iter = CompressedIterable(resp.app_iter, encoding)
+    else:
+        resp.body = compress(resp.body, encoding)
+    resp.content_encoding = encoding
+    return resp
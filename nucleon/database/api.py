@@ -1,6 +1,10 @@
-from functools import wraps
+import math
+from functools import wraps, partial
+
+from psycopg2.extensions import QueryCanceledError
 
 from ..config import settings
+from ..deadlines import DeadlineExceeded, remaining
 from .pgpool import PostgresConnectionPool
 from . import IntegrityError
 
@@ -122,6 +126,30 @@ def easy_query(func, query, *args, **kwargs):
             raise TypeError("Incorrect arguments")
 
 
+def execute(cursor, query, params):
+    """Execute a query on cursor, within the current deadline if any.
+
+    If a deadline is in effect, the time remaining is set as the
+    statement_timeout for the transaction, so that PostgreSQL abandons the
+    query once the request has been abandoned. The setting is sent with the
+    query, so that it costs no extra round trip. DeadlineExceeded is raised
+    if the query is cancelled or the deadline has already passed.
+
+    """
+    seconds = remaining()
+    if seconds is None:
+        return cursor.execute(query, params)
+    if seconds <= 0:
+        raise DeadlineExceeded()
+    timeout = max(1, int(math.ceil(seconds * 1000)))
+    try:
+        return cursor.execute(
+            'SET LOCAL statement_timeout = %d; ' % timeout + query, params
+        )
+    except QueryCanceledError:
+        raise DeadlineExceeded()
+
+
 class Transaction(object):
     """A wrapper for a single query/transaction.
 
@@ -148,7 +176,7 @@ class ConnectionProxy(object):
     def query(self, query, *args, **kwargs):
         """Make a query on the connection and return a Results object."""
         c = self._conn.cursor()
-        easy_query(c.execute, query, *args, **kwargs)
+        easy_query(partial(execute, c), query, *args, **kwargs)
         if c.description is None:
             return c.rowcount
         return Results(c.description, c.fetchall())
@@ -200,7 +228,7 @@ class Database(object):
         with self.get_pool().connection() as conn:
             c = conn.cursor()
             try:
-                c.execute(query, params)
+                execute(c, query, params)
                 conn.commit()
             except IntegrityError:
                 conn.rollback()
@@ -1,9 +1,12 @@
 import re
+import sys
 import psycopg2
 
 from contextlib import contextmanager
 from gevent.lock import Semaphore
 
+from ..deadlines import no_deadline
+
 
 def parse_database_url(url):
     """Parse a database URL and return a dictionary.
@@ -115,32 +118,57 @@ class PostgresConnectionPool(object):
         """
         self.sem.acquire()
         try:
-            conn = self.pool.pop(0)
-        except IndexError:
-            conn = self._connect()
+            try:
+                conn = self.pool.pop(0)
+            except IndexError:
+                conn = self._connect()
 
-        try:
-            yield conn
-        except psycopg2.OperationalError:
-            # Connection errors should result in the connection being removed
-            # from the pool.
-            #
-            # Unfortunately OperationalError could possibly mean other things and
-            # we don't know enough to determine which
             try:
-                conn.close()
-            finally:
-                self.size -= 1
-                conn = None
+                yield conn
+                conn.commit()
+            except psycopg2.OperationalError:
+                # Connection errors should result in the connection being
+                # removed from the pool.
+                #
+                # Unfortunately OperationalError could possibly mean other
+                # things and we don't know enough to determine which
+                self._discard(conn)
                 raise
+            except:
+                exc_info = sys.exc_info()
+                self._release(conn, rollback=True)
+                raise exc_info[0], exc_info[1], exc_info[2]
+            else:
+                self._release(conn)
+        finally:
+            self.sem.release()
+
+    def _release(self, conn, rollback=False):
+        """Reset a connection and return it to the pool.
+
+        This runs without a deadline, as the deadline of the request that
+        used the connection may already have passed. If the connection
+        cannot be reset it is closed instead.
+
+        """
+        try:
+            with no_deadline():
+                if rollback:
+                    conn.rollback()
+                conn.reset()
+        except Exception:
+            self._discard(conn)
         except:
-            conn.rollback()
+            self._discard(conn)
             raise
         else:
-            conn.commit()
-        finally:
-            if conn is not None:
-                conn.reset()
-                self.pool.append(conn)
-            self.sem.release()
+            self.pool.append(conn)
 
+    def _discard(self, conn):
+        """Close a connection and remove it from the pool's count."""
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        finally:
+            self.size -= 1
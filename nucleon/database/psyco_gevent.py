@@ -27,8 +27,18 @@ Use `make_psycopg_green()` to enable gevent support in Psycopg.
 import psycopg2
 from psycopg2 import extensions
 
+import gevent
+from gevent import socket
 from gevent.socket import wait_read, wait_write
 
+from ..deadlines import DeadlineExceeded, remaining
+
+
+# Exceptions that interrupt a query that may still be running on the server
+INTERRUPTIONS = (
+    socket.timeout, gevent.Timeout, DeadlineExceeded, gevent.GreenletExit
+)
+
 
 def make_psycopg_green():
     """Configure Psycopg to be used with gevent in non-blocking way."""
@@ -41,7 +51,34 @@ def make_psycopg_green():
 
 
 def gevent_wait_callback(conn, timeout=None):
-    """A wait callback useful to allow gevent to work with Psycopg."""
+    """A wait callback useful to allow gevent to work with Psycopg.
+
+    If no timeout is given, the time remaining until the current request's
+    deadline is used. If the wait is interrupted, the query is cancelled on
+    the server so that the connection can be used again; errors reported by
+    the server are raised without cancelling, as the query has already
+    ended.
+
+    """
+    if timeout is None:
+        timeout = remaining()
+        if timeout is not None:
+            timeout = max(timeout, 0)
+    try:
+        _wait(conn, timeout)
+    except INTERRUPTIONS as e:
+        try:
+            conn.cancel()
+            _wait(conn, None)
+        except psycopg2.Error:
+            pass
+        if isinstance(e, socket.timeout) and remaining() is not None:
+            raise DeadlineExceeded()
+        raise
+
+
+def _wait(conn, timeout):
+    """Wait for a query on conn to complete."""
     while 1:
         state = conn.poll()
         if state == extensions.POLL_OK:
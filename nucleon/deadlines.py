@@ -0,0 +1,106 @@
+"""Time budgets for serving requests.
+
+Code running within deadline() is interrupted with DeadlineExceeded if it
+has not finished when the deadline passes. The time remaining is available
+from remaining(), so that calls made on behalf of the request - database
+queries in particular - can be given a timeout that stops them running on
+after the request has been abandoned.
+
+Deadlines are tracked for each greenlet.
+
+"""
+
+import time
+from contextlib import contextmanager
+
+import gevent
+from gevent.local import local
+
+from .http import Http503
+
+
+__all__ = [
+    'DeadlineExceeded', 'deadline', 'no_deadline', 'remaining', 'propagate'
+]
+
+_state = local()
+
+
+class DeadlineExceeded(Http503):
+    """The deadline for serving a request has passed.
+
+    This is served to the client as a 503 Service Unavailable response.
+
+    """
+    def __init__(self, message="Deadline exceeded"):
+        super(DeadlineExceeded, self).__init__(message)
+
+
+@contextmanager
+def deadline(seconds):
+    """Interrupt the code within this context after seconds have elapsed.
+
+    DeadlineExceeded is raised within the current greenlet when the deadline
+    passes. If a deadline is already in effect, the earlier of the two
+    applies to remaining().
+
+    """
+    expires = time.time() + seconds
+    previous = getattr(_state, 'expires', None)
+    if previous is not None:
+        expires = min(expires, previous)
+    _state.expires = expires
+    timeout = gevent.Timeout(seconds, DeadlineExceeded())
+    timeout.start()
+    try:
+        yield
+    finally:
+        timeout.cancel()
+        _state.expires = previous
+
+
+@contextmanager
+def no_deadline():
+    """Hide the current deadline from remaining() within this context.
+
+    This is for cleanup that must run even after the deadline has passed,
+    such as rolling back a transaction, so that it is not given a timeout
+    that has already expired. An enclosing deadline() still interrupts the
+    code when it passes.
+
+    """
+    previous = getattr(_state, 'expires', None)
+    _state.expires = None
+    try:
+        yield
+    finally:
+        _state.expires = previous
+
+
+def remaining():
+    """Return the number of seconds until the current deadline.
+
+    Returns None if no deadline is in effect. The value may be zero or
+    negative if the deadline has already passed.
+
+    """
+    expires = getattr(_state, 'expires', None)
+    if expires is None:
+        return None
+    return expires - time.time()
+
+
+def propagate(func):
+    """Bind func to the current deadline, to be called in another greenlet.
+
+    Returns func unchanged if no deadline is in effect.
+
+    """
+    expires = getattr(_state, 'expires', None)
+    if expires is None:
+        return func
+
+    def call(*args, **kwargs):
+        with deadline(max(0, expires - time.time())):
+            return func(*args, **kwargs)
+    return call
@@ -1,13 +1,28 @@
 import sys
-import re
 import os
+import time
+import collections
+import functools
 import gevent
 
 from webob import Request, Response
 
 from .database.pgpool import PostgresConnectionPool
-from .http import Http404, Http503, HttpException, JsonResponse
-from .util import WaitCounter
+from .http import (
+    Http404, Http503, HttpException, JsonResponse, StreamingJsonResponse,
+    RawRequest
+)
+from .json_encoders import get_encoder
+from .compression import (
+    accepted_encoding, compress_response, negotiate, vary_response
+)
+from .routing import Router
+from .limits import Bulkhead
+from .deadlines import deadline
+from .tasks import TaskQueue
+from .batch import BatchView
+from .signals import Signal
+from .util import WaitCounter, CountedIterable, LRUCache
 from .config import settings, ConfigurationError
 
 import traceback
@@ -21,17 +36,309 @@ STATE_CLOSED = 3
 
 RETRY_AFTER_503 = 12
 
+# Retry-After for requests refused because a worker is at capacity
+RETRY_AFTER_OVERLOADED = 1
+
+# Headers of JSON responses from raw views, except Content-Length
+RAW_JSON_HEADERS = [('Content-Type', 'application/json')]
+
+# Number of distinct argument combinations a memoized view stores responses for
+MEMOIZED_RESPONSES = 128
+
+
+def make_response(resp):
+    """Convert the return value of a view to a Response."""
+    if isinstance(resp, Response):
+        return resp
+    if isinstance(resp, collections.Iterator):
+        return StreamingJsonResponse(resp)
+    return JsonResponse(resp)
+
+
+def not_modified(etag, vary=None):
+    """Build an empty 304 Not Modified response for a resource's ETag.
+
+    vary is the Vary header of the full response, which the 304 repeats.
+
+    """
+    resp = Response(status=304, headerlist=[], app_iter=[])
+    # WebOb before 1.7 adds a default Content-Type even to an empty headerlist
+    if 'Content-Type' in resp.headers:
+        del resp.headers['Content-Type']
+    resp.etag = etag
+    if vary:
+        resp.vary = vary
+    return resp
+
+
+def static_response(status, headerlist):
+    """Make a view that serves an empty response with the given headers."""
+    def respond(request, *args, **vars):
+        return Response(status=status, headerlist=list(headerlist), app_iter=[])
+    return respond
+
+
+class MemoizedView(object):
+    """Wraps a view so that its responses are served from memory.
+
+    The status, headers and encoded body of each successful response are
+    stored, and served to later requests with the same URL arguments and
+    query string without calling the view. If ttl is given, stored responses
+    expire after that many seconds; otherwise they are kept until
+    invalidate() is called.
+
+    If compress_min_size is given, compressed copies of stored bodies of at
+    least that size are also kept, for each encoding requested, so that
+    compressed responses can be served without compressing them again.
+
+    If etags is True, successful responses are given an ETag of their
+    uncompressed body before they are stored, so that every copy served
+    carries the same ETag (weak, if compressed).
+
+    """
+    def __init__(self, view, ttl=None, size=MEMOIZED_RESPONSES,
+            compress_min_size=None, etags=False):
+        functools.update_wrapper(self, view)
+        self.view = view
+        self.ttl = ttl
+        self.compress_min_size = compress_min_size
+        self.etags = etags
+        self.responses = LRUCache(size)
+
+    def __call__(self, request, *args, **vars):
+        key = (args, request.query_string)
+        entry = self.responses.get(key)
+        if entry is not None:
+            expires, status, headerlist, body, variants = entry
+            if expires is None or expires > time.time():
+                request.environ['nucleon.memoized'] = True
+                if self.compress_min_size is not None:
+                    encoding = accepted_encoding(request)
+                    if encoding is not None:
+                        return self._compressed(request, entry, encoding)
+                return Response(
+                    status=status, headerlist=list(headerlist), body=body
+                )
+
+        resp = make_response(self.view(request, *args, **vars))
+        if 200 <= resp.status_int < 300 and \
+                not isinstance(resp, StreamingJsonResponse):
+            expires = time.time() + self.ttl if self.ttl else None
+            if self.etags and resp.status_int == 200 and resp.etag is None:
+                resp.md5_etag()
+            self.responses.set(key, (
+                expires, resp.status, tuple(resp.headerlist), resp.body, {}
+            ))
+        return resp
+
+    def _compressed(self, request, entry, encoding):
+        """Serve a stored response compressed with the given encoding."""
+        expires, status, headerlist, body, variants = entry
+        try:
+            headerlist, body = variants[encoding]
+        except KeyError:
+            resp = Response(
+                status=status, headerlist=list(headerlist), body=body
+            )
+            resp = compress_response(request, resp, self.compress_min_size)
+            headerlist, body = tuple(resp.headerlist), resp.body
+            variants[encoding] = headerlist, body
+        return Response(status=status, headerlist=list(headerlist), body=body)
+
+    def invalidate(self, *args, **kwargs):
+        """Discard all stored responses.
+
+        Any arguments are ignored, so that this can be connected to a Signal.
+        """
+        self.responses.clear()
+
+
+class ConditionalView(object):
+    """Wraps a view so that conditional GETs can be answered without it.
+
+    etag is a function called with the same arguments as the view, which
+    returns the ETag of the resource or None. It should be cheaper than the
+    view itself; for example it could return a version number or
+    modification time stored with the resource. If the request's
+    If-None-Match header matches the ETag, a 304 response is served without
+    calling the view.
+
+    If compress is True, the response served by the view may be compressed,
+    so the 304 is given the Vary header and weak ETag that a compressed
+    response would have.
+
+    """
+    def __init__(self, view, etag, compress=False):
+        functools.update_wrapper(self, view)
+        self.view = view
+        self.etag = etag
+        self.compress = compress
+
+    def __call__(self, request, *args, **vars):
+        tag = self.etag(request, *args, **vars)
+        if tag is None:
+            return self.view(request, *args, **vars)
+        tag = str(tag)
+        if tag in request.if_none_match:
+            resp = not_modified(tag)
+            if self.compress:
+                vary_response(request, resp)
+            return resp
+        resp = make_response(self.view(request, *args, **vars))
+        if resp.status_int == 200:
+            resp.etag = tag
+        return resp
+
+
+class BulkheadView(object):
+    """Wraps a view so that it runs within a Bulkhead.
+
+    Requests that cannot be admitted to the bulkhead, or to its queue, are
+    refused with a 503 response.
+
+    """
+    def __init__(self, view, bulkhead):
+        functools.update_wrapper(self, view)
+        self.view = view
+        self.bulkhead = bulkhead
+
+    def __call__(self, request, *args, **vars):
+        if not self.bulkhead.acquire():
+            raise Http503("Too many requests", retry_after=RETRY_AFTER_OVERLOADED)
+        try:
+            return self.view(request, *args, **vars)
+        finally:
+            self.bulkhead.release()
+
+
+class DeadlineView(object):
+    """Wraps a view so that it is interrupted after a number of seconds.
+
+    This overrides any deadline set for the whole application.
+
+    """
+    def __init__(self, view, seconds):
+        functools.update_wrapper(self, view)
+        self.view = view
+        self.seconds = seconds
+
+    def __call__(self, request, *args, **vars):
+        with deadline(self.seconds):
+            return self.view(request, *args, **vars)
+
+
+class RawView(object):
+    """Wraps a view that is served without webob.
+
+    The view is called with a RawRequest rather than a webob Request, and
+    its return value is serialised and passed directly to the WSGI server.
+
+    """
+    def __init__(self, view):
+        functools.update_wrapper(self, view)
+        self.view = view
+
+    def __call__(self, request, *args, **vars):
+        return self.view(request, *args, **vars)
+
+
+class MethodTable(object):
+    """The views that serve each HTTP method for a single route.
+
+    The table is built once, when the route is added. HEAD requests are
+    served by the GET view, and OPTIONS requests are answered without calling
+    a view, unless views are given for those methods explicitly. Other
+    methods are answered with a precomputed 405 response.
+
+    """
+    def __init__(self, view):
+        if isinstance(view, dict):
+            views = dict(view)
+        else:
+            views = {'GET': view}
+
+        allowed = set(views)
+        allowed.add('OPTIONS')
+        if 'GET' in views:
+            allowed.add('HEAD')
+        self.allow = ', '.join(sorted(allowed))
+
+        headers = [
+            ('Content-Type', 'text/html; charset=UTF-8'),
+            ('Content-Length', '0'),
+            ('Allow', self.allow),
+        ]
+        if 'GET' in views:
+            # The body is discarded when the response is sent
+            views.setdefault('HEAD', views['GET'])
+        views.setdefault('OPTIONS', static_response(200, headers))
+        self.not_allowed = static_response(405, headers)
+        self.views = views
+
+    def get(self, method):
+        """Return the view that serves method."""
+        return self.views.get(method, self.not_allowed)
+
+    def allows(self, method):
+        """Return True if a view serves method."""
+        return method in self.views
+
 
 class Application(object):
     """Connects URLS to views and dispatch requests to them."""
-    def __init__(self):
+    def __init__(self, route_cache_size=0, etags=False,
+            compress_min_size=None, max_active_requests=None, limiter=None,
+            deadline=None, tasks=None):
         """
         Create a blank application.
+
+        If route_cache_size is given, the views resolved for up to that many
+        distinct (path, method) pairs are remembered, so that repeated
+        requests for the same URL skip pattern matching.
+
+        If etags is True, successful responses to GET requests are given a
+        strong ETag computed from their body, unless they already have one,
+        and requests whose If-None-Match header matches it are answered with
+        an empty 304 Not Modified response.
+
+        If compress_min_size is given, response bodies of at least that many
+        bytes are compressed with gzip or deflate for clients that accept
+        them. Streamed responses are compressed as they are sent.
+
+        If max_active_requests is given, each worker process serves at most
+        that many requests at once. Further requests are refused immediately
+        with a 503 Service Unavailable response, before any view is called;
+        the number refused is counted in shed_requests.
+
+        limiter may be given to limit the number of requests in progress
+        adaptively, according to their latency; see nucleon.limits. Requests
+        beyond its limit are refused in the same way.
+
+        If deadline is given, views that have not returned within that many
+        seconds are interrupted, and a 503 response is served instead. Routes
+        may set their own deadline with add_view().
+
+        tasks is the nucleon.tasks.TaskQueue used by defer(). By default a
+        queue with the default size, workers and overflow policy is used.
         """
         self.routes = []
+        self.router = Router()
+        self.etags = etags
+        self.compress_min_size = compress_min_size
+        self.has_raw_views = False
+        if route_cache_size:
+            self.route_cache = LRUCache(route_cache_size)
+        else:
+            self.route_cache = None
         self._dbs = {}
         self.running_state = STATE_SERVING
         self.active_requests_counter = WaitCounter()
+        self.max_active_requests = max_active_requests
+        self.limiter = limiter
+        self.shed_requests = 0
+        self.bulkheads = {}
+        self.deadline = deadline
+        self.tasks = tasks if tasks is not None else TaskQueue()
 
     def view(self, pattern, **vars):
         """Decorator that binds a view function to a URL pattern.
@@ -44,7 +351,9 @@ class Application(object):
             return view
         return _register
 
-    def add_view(self, pattern, view, **vars):
+    def add_view(self, pattern, view, memoize_body=None, invalidate_on=(),
+            etag=None, raw=False, max_concurrency=None, queue=0,
+            deadline=None, **vars):
         """Bind view functions to a given URL pattern.
 
         If view is a callable then this will be served when the request path
@@ -53,10 +362,142 @@ class Application(object):
         view can also be a dictionary mapping HTTP methods to different view
         functions.
 
+        HEAD requests are served by the GET view, and its response is sent
+        without a body, so that the status and headers match those of a GET
+        request. OPTIONS requests are answered automatically, without calling
+        a view. The dictionary may give views for either method instead; a
+        HEAD view that returns a fixed response is cheaper for frequent probes,
+        but will not reflect errors that the GET view would report. Requests
+        for any other method receive a 405 Method Not Allowed response.
+
         Any additional keyword parameters will be passed as keyword parameters
         when the view is requested.
+
+        pattern may contain typed placeholders such as <int:id> or
+        <uuid:key>, which are passed to the view already converted. If a
+        value cannot be converted the pattern does not match.
+
+        If more than one pattern matches a request path, the view that was
+        added first is used.
+
+        If memoize_body is given, the responses of the GET view are stored
+        and served again without calling the view; this is only suitable for
+        views whose response depends only on the URL. memoize_body may be
+        True, to keep responses until they are invalidated, or a number of
+        seconds after which they expire. invalidate_on is a Signal, or list
+        of Signals, on which stored responses are discarded.
+
+        If etag is given, it is called with the same arguments as the GET
+        view before the view is called, and should return the current ETag
+        of the resource (or None if it is unknown). If this matches the
+        request's If-None-Match header, a 304 Not Modified response is served
+        without calling the view.
+
+        If raw is True, the view is served without constructing webob
+        objects: it is passed a nucleon.http.RawRequest, which parses only
+        the parts of the request that are used, and its return value is
+        serialised straight to the WSGI server. Responses from raw views are
+        not given ETags or compressed, and raw cannot be combined with
+        memoize_body or etag.
+
+        If max_concurrency is given, at most that many requests for this
+        pattern are served at once, by any method; up to queue further
+        requests wait for a free slot, and any more are refused immediately
+        with a 503 response. This keeps an expensive route from holding every
+        database connection while cheaper routes wait. The slot is released
+        when the view returns, before a streamed response body is sent. If
+        the pattern is added again, it shares the same slots; giving it a
+        different max_concurrency or queue is an error.
+
+        If deadline is given, the views for this pattern are interrupted if
+        they have not returned within that many seconds, including any time
+        spent waiting for a slot, and a 503 response is served. This
+        overrides the application's deadline. Database queries made by the
+        view are given a statement_timeout of the time remaining; see
+        nucleon.deadlines.
+        """
+        if max_concurrency is not None:
+            bulkhead = self.bulkheads.get(pattern)
+            if bulkhead is None:
+                bulkhead = Bulkhead(max_concurrency, queue)
+            elif (bulkhead.max_concurrency, bulkhead.queue) != \
+                    (max_concurrency, queue):
+                raise ValueError(
+                    "Pattern %r already has max_concurrency=%d, queue=%d" % (
+                        pattern, bulkhead.max_concurrency, bulkhead.queue
+                    )
+                )
+            if isinstance(view, dict):
+                view = dict(
+                    (m, BulkheadView(v, bulkhead)) for m, v in view.items()
+                )
+            else:
+                view = BulkheadView(view, bulkhead)
+            self.bulkheads[pattern] = bulkhead
+
+        if deadline is not None and raw:
+            view = self._with_deadline(view, deadline)
+
+        if raw:
+            if memoize_body or etag is not None:
+                raise TypeError("raw views cannot use memoize_body or etag")
+            if isinstance(view, dict):
+                view = dict((m, RawView(v)) for m, v in view.items())
+            else:
+                view = RawView(view)
+            self.has_raw_views = True
+
+        if memoize_body:
+            ttl = None if memoize_body is True else memoize_body
+            if isinstance(view, dict):
+                view = dict(view)
+                view['GET'] = memoized = MemoizedView(
+                    view['GET'], ttl,
+                    compress_min_size=self.compress_min_size, etags=self.etags
+                )
+            else:
+                view = memoized = MemoizedView(
+                    view, ttl,
+                    compress_min_size=self.compress_min_size, etags=self.etags
+                )
+            if isinstance(invalidate_on, Signal):
+                invalidate_on = [invalidate_on]
+            for signal in invalidate_on:
+                signal.connect(memoized.invalidate)
+
+        if etag is not None:
+            compress = self.compress_min_size is not None
+            if isinstance(view, dict):
+                view = dict(view)
+                view['GET'] = ConditionalView(view['GET'], etag, compress)
+            else:
+                view = ConditionalView(view, etag, compress)
+
+        if deadline is not None and not raw:
+            view = self._with_deadline(view, deadline)
+
+        regex = self.router.add(pattern)[1]
+        self.routes.append((regex, MethodTable(view), vars))
+        if self.route_cache is not None:
+            self.route_cache.clear()
+
+    def add_batch_view(self, pattern='/batch', concurrency=8, max_requests=50):
+        """Serve batches of sub-requests with POST requests to pattern.
+
+        The body of a batch request is a JSON list of sub-requests, which are
+        dispatched to the application's views concurrently, at most
+        concurrency at a time; see nucleon.batch for the format. Batches of
+        more than max_requests sub-requests are refused.
         """
-        self.routes.append((re.compile('^%s$' % pattern), view, vars))
+        self.add_view(pattern, {
+            'POST': BatchView(self, concurrency, max_requests)
+        })
+
+    def _with_deadline(self, view, seconds):
+        """Wrap a view, or each view in a dictionary, in a DeadlineView."""
+        if isinstance(view, dict):
+            return dict((m, DeadlineView(v, seconds)) for m, v in view.items())
+        return DeadlineView(view, seconds)
 
     def get_config_string(self, name):
         return getattr(settings, name)
@@ -80,6 +521,19 @@ class Application(object):
         from nucleon.database.management import SQLScript
         return SQLScript.open(os.path.join(self._path, filename))
 
+    def defer(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) later, in a background greenlet.
+
+        This is intended for work that the client need not wait for, such as
+        writing audit records or warming caches. Deferred calls that are
+        still queued when the application stops serving are completed before
+        the worker exits, within the shutdown timeout.
+
+        Returns False if the call was dropped because the task queue is
+        full; see nucleon.tasks.
+        """
+        return self.tasks.defer(func, *args, **kwargs)
+
     def stop_serving(self, timeout=None):
         """
         Starts nucleon shutdown procedure and waits for its finish.
@@ -94,22 +548,77 @@ class Application(object):
 
     def _stop_serving_requests(self, timeout=None):
         """
-        Stops serving new http requests and waits for all existing to finish.
+        Stops serving new http requests and waits for all existing to finish,
+        and then for any deferred calls to finish.
 
         Arguments
 
         :timeout: timeout to wait for shutdown
 
         """
+        start = time.time()
         self.running_state = STATE_CLOSING
         self.active_requests_counter.wait_for_zero(timeout)
+        if timeout is not None:
+            timeout = max(0, timeout - (time.time() - start))
+        self.tasks.join(timeout)
 
     def __call__(self, environ, start_response):
+        resolved = None
+        if self.has_raw_views and self.running_state == STATE_SERVING:
+            try:
+                resolved = self._find_view(
+                    environ.get('PATH_INFO', ''), environ['REQUEST_METHOD']
+                )
+            except HttpException:
+                pass
+            else:
+                view, args, vars = resolved
+                if isinstance(view, RawView):
+                    return self._handle_raw(
+                        environ, start_response, view.view, args, vars
+                    )
         req = Request(environ)
-        resp = self._handle(req)
+        resp = self._handle(req, resolved)
         return resp(environ, start_response)
 
-    def _handle(self, request):
+    def _handle_raw(self, environ, start_response, view, args, vars):
+        """
+        Handles a request for a raw view
+
+        Serialises the view's return value without constructing a Response,
+        unless the view returns one itself, returns an iterator (which is
+        streamed as a JSON array) or raises an exception.
+        """
+        request = RawRequest(environ)
+        with self.active_requests_counter:
+            try:
+                self._admit()
+                resp = self._call_view(view, request, args, vars)
+                if isinstance(resp, collections.Iterator):
+                    resp = StreamingJsonResponse(resp)
+                    # Keep the request counted until the body has been sent
+                    resp.app_iter = CountedIterable(
+                        self.active_requests_counter, resp.app_iter
+                    )
+                elif not isinstance(resp, Response):
+                    body = get_encoder()(resp)
+            except HttpException, e:
+                resp = e.response(request)
+            except:
+                tb = traceback.format_exc()
+                print >>sys.stderr, tb
+                resp = Response(tb, status=500, content_type='text/plain')
+            if isinstance(resp, Response):
+                return resp(environ, start_response)
+        start_response('200 OK', RAW_JSON_HEADERS + [
+            ('Content-Length', str(len(body)))
+        ])
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return [body]
+
+    def _handle(self, request, resolved=None):
         """
         Handles a request
 
@@ -117,39 +626,171 @@ class Application(object):
         """
         with self.active_requests_counter:
             try:
-                resp = self._dispatch(request)
+                resp = self._dispatch(request, resolved)
             except HttpException, e:
                 resp = e.response(request)
             except:
                 tb = traceback.format_exc()
                 print >>sys.stderr, tb
                 resp = Response(tb, status=500, content_type='text/plain')
+            if isinstance(resp, StreamingJsonResponse):
+                # Keep the request counted until the body has been sent
+                resp.app_iter = CountedIterable(
+                    self.active_requests_counter, resp.app_iter
+                )
+            elif self.etags and request.method in ('GET', 'HEAD') and \
+                    resp.status_int == 200:
+                resp = self._conditional_response(request, resp)
+            if self.compress_min_size is not None:
+                resp = compress_response(request, resp, self.compress_min_size)
         return resp
 
-    def _dispatch(self, request):
+    def _conditional_response(self, request, resp):
+        """
+        Tags a response with an ETag, and checks it against If-None-Match
+
+        Returns resp, or a 304 response if the client's copy is current.
+        """
+        if resp.etag is None:
+            resp.md5_etag()
+        if resp.etag in request.if_none_match:
+            if self.compress_min_size is not None:
+                # Repeat the ETag and Vary the full response would be sent with
+                negotiate(request, resp, self.compress_min_size)
+            not_mod = not_modified(resp.etag, resp.vary)
+            not_mod.headers['ETag'] = resp.headers['ETag']
+            return not_mod
+        return resp
+
+    def _dispatch(self, request, resolved=None):
         """
         Handles a request
 
-        Called by _handle.
+        Called by _handle. resolved is the (view, args, vars) for the
+        request, if these have already been found.
         """
         if self.running_state == STATE_CLOSING:
             raise Http503("Shutting down", retry_after=RETRY_AFTER_503)
-        path = request.path_info
-        for regex, view, vars in self.routes:
-            match = regex.match(path)
-            if match:
-                if isinstance(view, dict):
-                    try:
-                        view = view[request.method]
-                    except KeyError:
-                        return Response('', allow=view.keys(), status=405)
-                elif request.method != 'GET':
-                    return Response('', allow=['GET'], status=405)
-
-                args = match.groups()
-                resp = view(request, *args, **vars)
-                if not isinstance(resp, Response):
-                    resp = JsonResponse(resp)
-                return resp
-        else:
+        self._admit()
+        if resolved is None:
+            resolved = self._find_view(request.path_info, request.method)
+        view, args, vars = resolved
+        return make_response(self._call_view(view, request, args, vars))
+
+    def _call_view(self, view, request, args, vars):
+        """
+        Calls a view within the application's deadline, if it has one
+        """
+        if self.deadline is None or isinstance(view, DeadlineView):
+            return self._timed_call(view, request, args, vars)
+        with deadline(self.deadline):
+            return self._timed_call(view, request, args, vars)
+
+    def _timed_call(self, view, request, args, vars):
+        """
+        Calls a view, recording its latency if there is an adaptive limit
+
+        Requests that are refused with a 503, or answered without work by a
+        memoized view or with 304 Not Modified, are not recorded.
+        """
+        if self.limiter is None:
+            return view(request, *args, **vars)
+        start = time.time()
+        served = True
+        try:
+            resp = view(request, *args, **vars)
+            served = not request.environ.get('nucleon.memoized') and \
+                getattr(resp, 'status_int', None) != 304
+            return resp
+        except Http503:
+            served = False
+            raise
+        finally:
+            if served:
+                self.limiter.record(
+                    time.time() - start, self.active_requests_counter.counter
+                )
+
+    def _admit(self):
+        """
+        Refuses the current request if too many requests are in progress
+
+        The current request must already be counted in
+        active_requests_counter. Raises Http503 if it would exceed
+        max_active_requests or the limit of the limiter.
+        """
+        active = self.active_requests_counter.counter
+        if (self.max_active_requests is not None and
+                active > self.max_active_requests) or \
+                (self.limiter is not None and not self.limiter.allows(active)):
+            self.shed_requests += 1
+            raise Http503("Too many requests", retry_after=RETRY_AFTER_OVERLOADED)
+
+    def stats(self):
+        """
+        Returns a dictionary of statistics about the requests being served
+
+        This includes the number of requests in progress and the number
+        refused, the state of the task queue, and the state of the route
+        cache, adaptive limit and per-route concurrency limits if these are
+        in use.
+        """
+        stats = {
+            'active_requests': self.active_requests_counter.counter,
+            'max_active_requests': self.max_active_requests,
+            'shed_requests': self.shed_requests,
+        }
+        if self.limiter is not None:
+            stats['limiter'] = self.limiter.stats()
+        if self.route_cache is not None:
+            stats['route_cache'] = self.route_cache.stats()
+        stats['tasks'] = self.tasks.stats()
+        if self.bulkheads:
+            stats['routes'] = dict(
+                (pattern, bulkhead.stats())
+                for pattern, bulkhead in self.bulkheads.items()
+            )
+        return stats
+
+    def _find_view(self, path, method):
+        """
+        Find the view that serves a request, using the route cache if enabled
+
+        Returns a tuple (view, args, vars), as _resolve().
+        """
+        if self.route_cache is None:
+            return self._resolve(path, method)
+        key = (path, method)
+        resolved = self.route_cache.get(key)
+        if resolved is None:
+            methods, args, vars = self._match(path)
+            resolved = methods.get(method), args, vars
+            # 404s and 405s are not cached, so that requests for unexpected
+            # URLs or methods cannot evict useful entries
+            if methods.allows(method):
+                self.route_cache.set(key, resolved)
+        return resolved
+
+    def _resolve(self, path, method):
+        """
+        Find the view that serves a request
+
+        Returns a tuple (view, args, vars). Raises Http404 if no pattern
+        matches path.
+        """
+        methods, args, vars = self._match(path)
+        return methods.get(method), args, vars
+
+    def _match(self, path):
+        """
+        Find the route that matches a path
+
+        Returns a tuple (methods, args, vars), where methods is the route's
+        MethodTable. Raises Http404 if no pattern matches path.
+        """
+        match = self.router.match(path)
+        if match is None:
             raise Http404("No pattern matches this URL.")
+        index, args = match
+        methods, vars = self.routes[index][1:]
+        return methods, args, vars
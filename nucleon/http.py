@@ -1,6 +1,64 @@
-import datetime
-import json
+import itertools
+import urlparse
 from webob import Response
+from webob.headers import EnvironHeaders
+from webob.multidict import MultiDict
+
+from .json_encoders import get_encoder, serialize_date_to_json
+from .util import cached_property
+
+# Approximate size of the chunks in which streamed responses are written
+STREAM_CHUNK_SIZE = 8192
+
+
+class RawRequest(object):
+    """A minimal request object for views registered with raw=True.
+
+    This wraps the WSGI environ without copying or parsing it; each property
+    is computed only when it is first read.
+
+    """
+    def __init__(self, environ):
+        self.environ = environ
+
+    @property
+    def method(self):
+        return self.environ['REQUEST_METHOD']
+
+    @property
+    def path_info(self):
+        return self.environ.get('PATH_INFO', '')
+
+    @property
+    def query_string(self):
+        return self.environ.get('QUERY_STRING', '')
+
+    @property
+    def remote_addr(self):
+        return self.environ.get('REMOTE_ADDR')
+
+    @cached_property
+    def headers(self):
+        """The request headers, as a case-insensitive mapping."""
+        return EnvironHeaders(self.environ)
+
+    @cached_property
+    def GET(self):
+        """The parameters in the query string, as a MultiDict."""
+        return MultiDict(urlparse.parse_qsl(
+            self.query_string, keep_blank_values=True
+        ))
+
+    @cached_property
+    def body(self):
+        """The request body, read from wsgi.input."""
+        try:
+            length = int(self.environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return ''
+        return self.environ['wsgi.input'].read(length)
 
 
 class HttpException(Exception):
@@ -96,28 +154,12 @@ class Http503(HttpException):
             msg['message'] = self.args[0]
         elif len(self.args) > 1:
             msg['message'] = self.args
+        resp = JsonResponse(msg, status=self.status_code)
         if self.retry_after:
-            resp = JsonResponse(msg, status=self.status_code, headerlist=[('Retry-After', self.retry_after)])
-        else:
-            resp = JsonResponse(msg, status=self.status_code)
+            resp.headers['Retry-After'] = str(self.retry_after)
         return resp
 
 
-def serialize_date_to_json(obj):
-    """Convert Python datetimes to ISO8601-compatible strings.
-
-    This function is suitable for serialising to JSON Python
-    datetime objects such as those retrieved from the DB API.
-
-    """
-    if isinstance(obj, datetime.datetime) or isinstance(obj, datetime.time):
-        return obj.replace(microsecond=0).isoformat()
-    elif isinstance(obj, datetime.date):
-        return obj.isoformat()
-    else:
-        raise TypeError("Cannot convert %r to JSON" % obj)
-
-
 class JsonResponse(Response):
     """A response that converts its body to JSON.
 
@@ -125,6 +167,9 @@ class JsonResponse(Response):
     the database API to a JsonResponse, this class uses a JSON encoder that
     will serialize these types in ISO8601 format.
 
+    The encoder used is selected with the json_encoder setting; see
+    nucleon.json_encoders.
+
     """
     def __init__(self, obj, **kwargs):
         """Construct a JSON response.
@@ -138,10 +183,76 @@ class JsonResponse(Response):
             'content_type': 'application/json'
         }
         ps.update(kwargs)
-        body = json.dumps(obj, default=serialize_date_to_json)
+        body = get_encoder()(obj)
         super(JsonResponse, self).__init__(body, **ps)
 
 
+def iter_json_chunks(iterator, start, separator, end):
+    """Serialise objects from iterator as JSON, yielding chunks of output.
+
+    Each object is serialised as it is retrieved, and the output is buffered
+    into chunks of around STREAM_CHUNK_SIZE bytes.
+
+    """
+    encode = get_encoder()
+    buf = [start]
+    size = len(start)
+    sep = ''
+    for obj in iterator:
+        s = sep + encode(obj)
+        sep = separator
+        buf.append(s)
+        size += len(s)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    buf.append(end)
+    yield ''.join(buf)
+
+
+class StreamingJsonResponse(Response):
+    """A response that serialises the objects in an iterable as it is sent.
+
+    The objects are written as a JSON array or, if ndjson is True, as
+    newline-delimited JSON. The body is written incrementally without a
+    Content-Length, so the response is sent with chunked transfer encoding
+    and the objects need never all be in memory at once.
+
+    Views that return a generator or other iterator are served with this
+    class automatically.
+
+    """
+    def __init__(self, iterable, ndjson=False, **kwargs):
+        """Construct a streaming JSON response.
+
+        The first object is retrieved from iterable immediately, so that
+        errors raised before any objects are produced (such as Http404) are
+        handled as they would be for any other response. Errors raised after
+        that point will truncate the response.
+
+        """
+        if ndjson:
+            ps = {'content_type': 'application/x-ndjson'}
+            start, separator, end = '', '\n', '\n'
+        else:
+            ps = {'content_type': 'application/json'}
+            start, separator, end = '[', ',', ']'
+        ps.update(kwargs)
+
+        iterator = iter(iterable)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            if ndjson:
+                start = end = ''
+            chunks = [start + end]
+        else:
+            iterator = itertools.chain([first], iterator)
+            chunks = iter_json_chunks(iterator, start, separator, end)
+        super(StreamingJsonResponse, self).__init__(app_iter=chunks, **ps)
+
+
 class JsonErrorResponse(JsonResponse):
     """An HTTP 400 error response with a JSON body."""
     def __init__(self, obj, **kwargs):
@@ -0,0 +1,108 @@
+"""Pluggable JSON encoders for serialising responses.
+
+The encoder used by JsonResponse is selected with the json_encoder setting
+in app.cfg, for example::
+
+    [default]
+    json_encoder = simplejson
+
+The default is the standard library json module, which is C-accelerated.
+Further encoders can be added with register_encoder(). If a configured
+encoder cannot be imported, the standard library encoder is used instead.
+
+Each encoder is constructed once and reused for every response, rather than
+being constructed for each call as json.dumps() does when given a default
+function.
+
+"""
+
+import json
+import logging
+import datetime
+
+from .config import settings, ConfigurationError
+
+
+__all__ = ['get_encoder', 'load_encoder', 'register_encoder']
+
+DEFAULT_ENCODER = 'json'
+
+logger = logging.getLogger(__name__)
+
+
+def serialize_date_to_json(obj):
+    """Convert Python datetimes to ISO8601-compatible strings.
+
+    This function is suitable for serialising to JSON Python
+    datetime objects such as those retrieved from the DB API.
+
+    """
+    if isinstance(obj, datetime.datetime) or isinstance(obj, datetime.time):
+        return obj.replace(microsecond=0).isoformat()
+    elif isinstance(obj, datetime.date):
+        return obj.isoformat()
+    else:
+        raise TypeError("Cannot convert %r to JSON" % obj)
+
+
+def make_json_encoder():
+    """Build an encoder using the standard library json module."""
+    return json.JSONEncoder(default=serialize_date_to_json).encode
+
+
+def make_simplejson_encoder():
+    """Build an encoder using simplejson."""
+    import simplejson
+    return simplejson.JSONEncoder(default=serialize_date_to_json).encode
+
+
+# Encoder factories, by name. Each is called with no arguments and returns a
+# function that takes an object and returns it serialised as a JSON string.
+ENCODERS = {
+    'json': make_json_encoder,
+    'simplejson': make_simplejson_encoder,
+}
+
+
+def register_encoder(name, factory):
+    """Register a JSON encoder that can be selected by name in settings.
+
+    factory is called with no arguments when the encoder is first needed, and
+    must return a function that serialises an object to a JSON string. The
+    function should serialise dates and times in the same way as
+    serialize_date_to_json.
+
+    """
+    ENCODERS[name] = factory
+
+
+def load_encoder(name):
+    """Build the named encoder.
+
+    Raises ConfigurationError if no encoder is registered with that name.
+
+    """
+    try:
+        factory = ENCODERS[name]
+    except KeyError:
+        raise ConfigurationError("Unknown JSON encoder: %s" % name)
+    try:
+        return factory()
+    except ImportError as e:
+        logger.warning("Couldn't load JSON encoder %s (%s); using json" % (name, e))
+        return make_json_encoder()
+
+
+_encoder = None
+
+
+def get_encoder():
+    """Return the encoder selected in settings.
+
+    The encoder is loaded when this is first called, and reused thereafter.
+
+    """
+    global _encoder
+    if _encoder is None:
+        _encoder = load_encoder(getattr(settings, 'json_encoder', DEFAULT_ENCODER))
+    return _encoder
@@ -0,0 +1,163 @@
+"""Concurrency limits that adapt to the latency of requests.
+
+A fixed limit on the number of requests in progress is either too low, and
+wastes capacity, or too high, and lets the database or other backends be
+overwhelmed. An adaptive limit instead watches how latency changes as
+concurrency rises: while latency stays close to the lowest latency seen, the
+limit is allowed to grow; once requests start queueing somewhere and latency
+rises, the limit is reduced in proportion.
+
+A Bulkhead instead applies a fixed limit to a single route, so that an
+expensive route cannot occupy every database connection and starve the
+others.
+
+"""
+
+import math
+
+from gevent.lock import Semaphore
+
+
+__all__ = ['GradientLimit', 'Bulkhead']
+
+
+class GradientLimit(object):
+    """A concurrency limit adjusted by the gradient of observed latency.
+
+    After each request, the limit is scaled by the ratio of the lowest
+    recent latency to the smoothed current latency, and a small allowance
+    (the square root of the limit) is added so that the limit can grow when
+    latency is not rising. The lowest latency is taken only over the last
+    one or two windows of requests, so that a single fast outlier does not
+    hold the limit down and the limit can recover if the no-load latency
+    changes.
+
+    """
+    # Weight of each new sample in the smoothed latency
+    LATENCY_WEIGHT = 0.1
+
+    def __init__(self, initial=20, min_limit=1, max_limit=1000,
+            smoothing=0.2, window=500):
+        """Create a limit.
+
+        initial is the starting limit, which will always be kept between
+        min_limit and max_limit. smoothing is the weight given to each new
+        estimate of the limit. The lowest latency is re-learned every window
+        requests.
+
+        Only requests that did work should be recorded; requests answered
+        from memory or refused with 503 would make the lowest latency
+        unrepresentative of the requests the limit protects.
+
+        """
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.smoothing = smoothing
+        self.window = window
+        self.latency = None
+        self.min_latency = None
+        self.window_min_latency = None
+        self.samples = 0
+
+    def __str__(self):
+        return '<%s limit=%d latency=%s min_latency=%s>' % (
+            self.__class__.__name__, self.limit, self.latency, self.min_latency
+        )
+
+    def allows(self, active):
+        """Return True if active requests in progress are within the limit."""
+        return active <= int(self.limit)
+
+    def record(self, latency, active):
+        """Update the limit after a request taking latency seconds.
+
+        active is the number of requests that were in progress, including
+        this one.
+
+        """
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * self.LATENCY_WEIGHT
+        if self.min_latency is None or latency < self.min_latency:
+            self.min_latency = latency
+        if self.window_min_latency is None or \
+                latency < self.window_min_latency:
+            self.window_min_latency = latency
+        self.samples += 1
+        if self.samples % self.window == 0:
+            # Forget samples from before the window that has just ended
+            self.min_latency = self.window_min_latency
+            self.window_min_latency = None
+
+        if self.latency > 0:
+            gradient = max(0.5, min(1.0, self.min_latency / self.latency))
+        else:
+            gradient = 1.0
+
+        # Don't grow the limit while it is not being used, or it will be far
+        # too high when load does arrive.
+        if gradient == 1.0 and active < self.limit / 2:
+            return
+
+        estimate = self.limit * gradient + math.sqrt(self.limit)
+        limit = self.limit * (1 - self.smoothing) + estimate * self.smoothing
+        self.limit = max(self.min_limit, min(self.max_limit, limit))
+
+    def stats(self):
+        """Return a dictionary describing the current state of the limit."""
+        return {
+            'limit': int(self.limit),
+            'latency': self.latency,
+            'min_latency': self.min_latency,
+        }
+
+
+class Bulkhead(object):
+    """A limit on the number of requests in progress for one route.
+
+    Up to max_concurrency requests may run at once. Up to queue further
+    requests wait for one of them to finish; beyond that, requests are
+    rejected immediately rather than waiting.
+
+    """
+    def __init__(self, max_concurrency, queue=0):
+        self.max_concurrency = max_concurrency
+        self.queue = queue
+        self.sem = Semaphore(max_concurrency)
+        self.waiting = 0
+        self.rejected = 0
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if necessary.
+
+        Returns False, without waiting, if the queue is full.
+
+        """
+        if self.sem.locked():
+            if self.waiting >= self.queue:
+                self.rejected += 1
+                return False
+            self.waiting += 1
+            try:
+                self.sem.acquire()
+            finally:
+                self.waiting -= 1
+        else:
+            self.sem.acquire()
+        return True
+
+    def release(self):
+        """Give up a slot taken with acquire()."""
+        self.sem.release()
+
+    def stats(self):
+        """Return a dictionary describing the current use of the bulkhead."""
+        return {
+            'max_concurrency': self.max_concurrency,
+            'queue': self.queue,
+            'active': self.max_concurrency - self.sem.counter,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+        }
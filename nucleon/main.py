@@ -33,6 +33,16 @@ from .config import settings
 
 
 HALT_TIMEOUT = 10
+
+# Default length of the queue of connections waiting to be accepted. The
+# kernel may cap this (see net.core.somaxconn).
+DEFAULT_BACKLOG = 1024
+
+# Python 2 does not define SO_REUSEPORT; this is its value on Linux
+SO_REUSEPORT = getattr(
+    python_socket, 'SO_REUSEPORT',
+    15 if sys.platform.startswith('linux') else None
+)
 logger = logging.getLogger(__name__)
 
 
@@ -148,9 +158,58 @@ def bootstrap_gevent():
     psyco_gevent.make_psycopg_green()
 
 
+def make_listener(host, port, backlog=DEFAULT_BACKLOG, reuse_port=False):
+    """Bind a listening socket.
+
+    If reuse_port is True the socket is bound with SO_REUSEPORT, so that
+    several sockets may be bound to the same address; the kernel then
+    distributes incoming connections between them.
+
+    """
+    listener_socket = gevent_socket()
+    # Make the address reusable
+    listener_socket.setsockopt(
+        python_socket.SOL_SOCKET, python_socket.SO_REUSEADDR, 1
+    )
+    if reuse_port:
+        listener_socket.setsockopt(python_socket.SOL_SOCKET, SO_REUSEPORT, 1)
+    listener_socket.bind((host, port))
+    listener_socket.listen(backlog)
+    return listener_socket
+
+
+def make_reuseport_listeners(host, port, backlog, count):
+    """Bind count sockets to the same address with SO_REUSEPORT.
+
+    Returns None if SO_REUSEPORT is not supported.
+
+    """
+    if SO_REUSEPORT is None:
+        return None
+    listeners = []
+    try:
+        for i in xrange(count):
+            listeners.append(make_listener(host, port, backlog, reuse_port=True))
+    except python_socket.error as e:
+        for l in listeners:
+            l.close()
+        if e.errno not in (errno.ENOPROTOOPT, errno.EINVAL):
+            raise
+        return None
+    return listeners
+
+
 def serve(app, access_log, error_log, host, port,
-        user, group, no_daemonise, pidfile, processes=4):
-    """Start the server. Does not return."""
+        user, group, no_daemonise, pidfile, processes=4,
+        backlog=DEFAULT_BACKLOG, reuse_port=False):
+    """Start the server. Does not return.
+
+    By default, a single listening socket is shared by all the worker
+    processes. If reuse_port is True, each worker is given its own socket
+    bound with SO_REUSEPORT, so that the kernel balances connections between
+    workers; if SO_REUSEPORT is not supported, the shared socket is used.
+
+    """
     with open(access_log, 'a+') as access_file:
         if no_daemonise:
             # Log to the console when not daemonised
@@ -167,15 +226,20 @@ def serve(app, access_log, error_log, host, port,
             format="%(asctime)s [%(process)s] %(name)s.%(levelname)s: %(message)s",
         )
 
-        # setup a listener socket before dropping permissions
+        # setup listener sockets before dropping permissions
+        listeners = None
         try:
-            listener_socket = gevent_socket()
-            # Make the address reusable
-            listener_socket.setsockopt(
-                python_socket.SOL_SOCKET, python_socket.SO_REUSEADDR, 1
-            )
-            listener_socket.bind((host, port))
-            listener_socket.listen(5)
+            if reuse_port:
+                listeners = make_reuseport_listeners(
+                    host, port, backlog, processes
+                )
+                if listeners is None:
+                    logger.warning(
+                        "SO_REUSEPORT is not supported; "
+                        "using a shared listening socket"
+                    )
+            if listeners is None:
+                listener_socket = make_listener(host, port, backlog)
         except python_socket.error as e:
             logger.error("Can't bind socket: %s", e)
             sys.exit(1)
@@ -189,8 +253,15 @@ def serve(app, access_log, error_log, host, port,
                 logger.debug('now daemonising')
                 daemonise_nucleon(pidfile, user, group)
 
-            d = MultiprocessDaemon(webserver_serve, access_file, app, listener_socket)
-            d.at_exit.connect(listener_socket.close)
+            if listeners is None:
+                d = MultiprocessDaemon(webserver_serve, access_file, app, listener_socket)
+                d.at_exit.connect(listener_socket.close)
+            else:
+                d = MultiprocessDaemon(
+                    webserver_serve, access_file, app, listeners=listeners
+                )
+                for l in listeners:
+                    d.at_exit.connect(l.close)
             d.start(processes)
         finally:
             sys.exit(0)
@@ -267,9 +338,14 @@ class MultiprocessDaemon(object):
 
     Each worker will perform the callable given in the constructor.
 
+    If listeners is given, it is a list of sockets, one for each worker;
+    the worker's socket is passed to it as the listener_socket keyword
+    argument, and a worker that is respawned is given the same socket.
+
     """
     def __init__(self, worker, access_file, *args, **kwargs):
-        self.workers = set()
+        self.workers = {}  # pid -> worker slot
+        self.listeners = kwargs.pop('listeners', None)
         self.worker = worker
         self.access_file = access_file
         self.args = args
@@ -299,7 +375,7 @@ class MultiprocessDaemon(object):
             self.is_child_process = False
 
             for proc in xrange(processes):
-                self.spawn_worker()
+                self.spawn_worker(proc)
 
             # Read logs from the workers over their log pipe
             logger.debug('MPD.start: now waiting in the master thread')
@@ -330,12 +406,12 @@ class MultiprocessDaemon(object):
             # logger.debug('MPD.on_worker_exit: finished os.wait(). workers: %d' % len(self.workers))
 
             if pid in self.workers:
-                self.workers.remove(pid)
+                slot = self.workers.pop(pid)
                 if not self.keeprunning:
                     # Don't respawn if we're shutting down
                     return
                 logger.debug("MPD.on_worker_exit: Worker process exited. Respawning.")
-                self.spawn_worker()
+                self.spawn_worker(slot)
 
         except OSError as e:
             return
@@ -386,8 +462,13 @@ class MultiprocessDaemon(object):
         finally:
             os.close(rfd)
 
-    def spawn_worker(self):
-        """Spawn a new worker."""
+    def spawn_worker(self, slot=0):
+        """Spawn a new worker.
+
+        slot is the index of the worker, which selects its listening socket
+        if each worker has its own.
+
+        """
         # Enable Gevent's libev child watcher to reap children (catch SIGCHLD)
         gevent.get_hub().loop.install_sigchld()
 
@@ -398,19 +479,25 @@ class MultiprocessDaemon(object):
             os.close(wfd)
             self.logger_threads.append(gevent.spawn(self.logger, rfd))
 
-            self.workers.add(pid)
+            self.workers[pid] = slot
             os.setpgid(pid, os.getpid())  # Add child to our process group
             self._wait_lock = gevent.coros.RLock()
         else:
             gevent.killall(self.logger_threads)
             self.logger_threads = []
-            self.workers = []
+            self.workers = {}
             os.close(rfd)
             self.is_child_process = True
             self._wait_lock = None
 
             w = GreenWriter(wfd)
             self.kwargs['logfile'] = w
+            if self.listeners is not None:
+                # Keep only this worker's socket open
+                for i, l in enumerate(self.listeners):
+                    if i != slot:
+                        l.close()
+                self.kwargs['listener_socket'] = self.listeners[slot]
 
             # logger.debug("MPD.spawn_worker: Worker started. kwargs=%s" % self.kwargs)
             try:
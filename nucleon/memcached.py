@@ -0,0 +1,480 @@
+"""A memcached client for a cluster of servers.
+
+Keys are distributed between servers by consistent hashing, compatible with
+libketama, so that adding or removing a server moves only a fraction of the
+keys. Each worker keeps a bounded pool of connections to each server.
+Connecting and reading are subject to timeouts, and a server that fails is
+not contacted again for a few seconds, so that requests for keys on a dead
+server fail fast rather than stalling greenlets; to callers such failures
+look like cache misses.
+
+The servers are configured in app.cfg::
+
+    [default]
+    memcached_servers = 10.0.0.1:11211 10.0.0.2:11211:2
+
+Each server may be followed by a weight. The optional settings
+memcached_connect_timeout, memcached_timeout (both in seconds) and
+memcached_pool_size override the defaults below.
+
+"""
+
+import re
+import math
+import time
+import socket
+import bisect
+import hashlib
+import logging
+import cPickle as pickle
+from contextlib import contextmanager
+
+from gevent import socket as gevent_socket
+from gevent.lock import Semaphore
+
+from .config import settings
+from .parallel import parallel
+
+
+__all__ = ['MemcacheClient', 'Ring', 'normalise_key', 'parse_servers']
+
+DEFAULT_SERVERS = '127.0.0.1:11211'
+DEFAULT_PORT = 11211
+CONNECT_TIMEOUT = 0.25
+TIMEOUT = 0.5
+POOL_SIZE = 10
+
+# Seconds for which a server is not contacted after it fails
+DEAD_RETRY = 5
+
+# Points on the ring per server, for servers of average weight
+POINTS_PER_SERVER = 160
+
+# Keys longer than this, or containing these characters, are hashed
+MAX_KEY_LENGTH = 250
+INVALID_KEY_CHARS = re.compile(r'[\x00-\x20\x7f]')
+HASHED_KEY_PREFIX = 'sha1:'
+
+# Flags stored with values, describing how they are serialised
+FLAG_STR = 0
+FLAG_PICKLE = 1
+FLAG_INT = 2
+
+logger = logging.getLogger(__name__)
+
+
+class MemcacheError(Exception):
+    """A server could not be contacted, or gave an unexpected response."""
+
+
+def parse_servers(value):
+    """Parse a list of servers in the form host[:port[:weight]].
+
+    Servers may be separated by commas or whitespace. Returns a list of
+    ((host, port), weight).
+
+    """
+    servers = []
+    for server in value.replace(',', ' ').split():
+        parts = server.split(':')
+        if len(parts) > 3:
+            raise ValueError("Invalid memcached server %r" % server)
+        host = parts[0]
+        port = int(parts[1]) if len(parts) > 1 else DEFAULT_PORT
+        weight = int(parts[2]) if len(parts) > 2 else 1
+        servers.append(((host, port), weight))
+    return servers
+
+
+class Ring(object):
+    """A ketama continuum, mapping keys to servers."""
+
+    def __init__(self, servers):
+        """Build the continuum for a list of ((host, port), weight)."""
+        total_weight = sum(weight for address, weight in servers)
+        points = []
+        for address, weight in servers:
+            name = '%s:%d' % address
+            count = int(math.floor(
+                POINTS_PER_SERVER / 4 * len(servers) * weight / float(total_weight)
+            ))
+            for i in xrange(count):
+                digest = hashlib.md5('%s-%d' % (name, i)).digest()
+                for j in xrange(4):
+                    points.append((self.point(digest, j), address))
+        points.sort()
+        self.points = [p for p, address in points]
+        self.addresses = [address for p, address in points]
+
+    @staticmethod
+    def point(digest, i=0):
+        """Return the ith 32-bit point from an md5 digest."""
+        b = [ord(c) for c in digest[i * 4:i * 4 + 4]]
+        return (b[3] << 24) | (b[2] << 16) | (b[1] << 8) | b[0]
+
+    def get(self, key):
+        """Return the address of the server that holds key."""
+        index = bisect.bisect(self.points, self.point(hashlib.md5(key).digest()))
+        if index == len(self.points):
+            index = 0
+        return self.addresses[index]
+
+
+class Connection(object):
+    """A connection to a memcached server."""
+
+    def __init__(self, address, connect_timeout, timeout):
+        self.sock = gevent_socket.create_connection(
+            address, timeout=connect_timeout
+        )
+        self.sock.settimeout(timeout)
+        self.file = self.sock.makefile('rb')
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        line = self.file.readline()
+        if not line.endswith('\r\n'):
+            raise MemcacheError("Connection closed")
+        return line[:-2]
+
+    def read(self, length):
+        """Read a data block of length bytes, and its terminating CRLF."""
+        data = self.file.read(length + 2)
+        if len(data) != length + 2:
+            raise MemcacheError("Connection closed")
+        return data[:-2]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+class ServerPool(object):
+    """A bounded pool of connections to one server."""
+
+    def __init__(self, address, size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT, timeout=TIMEOUT):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.sem = Semaphore(size)
+        self.pool = []
+        self.dead_until = 0
+
+    @contextmanager
+    def connection(self):
+        """Obtain a connection, as a context manager.
+
+        Raises MemcacheError without waiting if the server failed recently.
+        If an error occurs while the connection is in use, it is closed
+        rather than returned to the pool.
+
+        """
+        if self.dead_until > time.time():
+            raise MemcacheError("Server %s:%d is down" % self.address)
+        self.sem.acquire()
+        try:
+            try:
+                conn = self.pool.pop()
+            except IndexError:
+                conn = self._connect()
+            try:
+                yield conn
+            except:
+                conn.close()
+                raise
+            else:
+                self.pool.append(conn)
+        finally:
+            self.sem.release()
+
+    def _connect(self):
+        try:
+            return Connection(self.address, self.connect_timeout, self.timeout)
+        except (socket.error, socket.timeout) as e:
+            self.mark_dead()
+            raise MemcacheError("Couldn't connect to %s:%d: %s" % (
+                self.address + (e,)
+            ))
+
+    def mark_dead(self):
+        """Stop contacting the server for DEAD_RETRY seconds."""
+        self.dead_until = time.time() + DEAD_RETRY
+
+
+def serialise(value):
+    """Return (flags, data) for a value to be stored."""
+    if isinstance(value, str):
+        return FLAG_STR, value
+    if isinstance(value, (int, long)) and not isinstance(value, bool):
+        return FLAG_INT, str(value)
+    return FLAG_PICKLE, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def deserialise(flags, data):
+    """Return the value stored as data with the given flags."""
+    if flags == FLAG_STR:
+        return data
+    if flags == FLAG_INT:
+        return int(data)
+    if flags == FLAG_PICKLE:
+        return pickle.loads(data)
+    raise MemcacheError("Unknown flags %d" % flags)
+
+
+def normalise_key(key):
+    """Return a key that memcached will accept in place of key.
+
+    Keys longer than MAX_KEY_LENGTH bytes, or containing whitespace or
+    control characters, are replaced by a hash of their contents.
+
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf8')
+    if len(key) > MAX_KEY_LENGTH or INVALID_KEY_CHARS.search(key):
+        return HASHED_KEY_PREFIX + hashlib.sha1(key).hexdigest()
+    return key
+
+
+def expiry_time(expiry):
+    """Convert an expiry in seconds to the integer memcached expects."""
+    return int(math.ceil(expiry)) if expiry else 0
+
+
+class MemcacheClient(object):
+    """A client for a cluster of memcached servers.
+
+    Errors communicating with servers are logged and treated as misses, or
+    as failures to store.
+
+    """
+    def __init__(self, servers, connect_timeout=CONNECT_TIMEOUT,
+            timeout=TIMEOUT, pool_size=POOL_SIZE):
+        """Create a client for a list of ((host, port), weight)."""
+        if not servers:
+            raise ValueError("No memcached servers given")
+        self.servers = servers
+        self.ring = Ring(servers)
+        self.pools = dict(
+            (address, ServerPool(address, pool_size, connect_timeout, timeout))
+            for address, weight in servers
+        )
+
+    @classmethod
+    def from_settings(cls):
+        """Create a client for the servers configured in settings."""
+        servers = parse_servers(
+            getattr(settings, 'memcached_servers', DEFAULT_SERVERS)
+        )
+        return cls(
+            servers,
+            connect_timeout=float(getattr(
+                settings, 'memcached_connect_timeout', CONNECT_TIMEOUT
+            )),
+            timeout=float(getattr(settings, 'memcached_timeout', TIMEOUT)),
+            pool_size=int(getattr(settings, 'memcached_pool_size', POOL_SIZE)),
+        )
+
+    def pool_for(self, key):
+        """Return the connection pool of the server that holds key."""
+        return self.pools[self.ring.get(key)]
+
+    def group_keys(self, keys):
+        """Group keys by the connection pool of the server that holds them."""
+        groups = {}
+        for key in keys:
+            groups.setdefault(self.pool_for(key), []).append(key)
+        return groups
+
+    def _each_server(self, groups, func):
+        """Call func(pool, keys) for each group, concurrently.
+
+        Returns a list of the results.
+
+        """
+        if len(groups) == 1:
+            return [func(*groups.items()[0])]
+        return parallel(*[
+            lambda pool=pool, keys=keys: func(pool, keys)
+            for pool, keys in groups.items()
+        ])
+
+    def _connection(self, key):
+        """Obtain a connection to the server for key."""
+        return self._pool_connection(self.pool_for(key))
+
+    @contextmanager
+    def _pool_connection(self, pool):
+        """Obtain a connection from a pool.
+
+        Socket errors mark the server as down and are raised as
+        MemcacheError.
+
+        """
+        with pool.connection() as conn:
+            try:
+                yield conn
+            except (socket.error, socket.timeout) as e:
+                pool.mark_dead()
+                raise MemcacheError("Error talking to %s:%d: %s" % (
+                    pool.address + (e,)
+                ))
+
+    def get(self, key):
+        """Return the value stored for key, or None."""
+        key = normalise_key(key)
+        return self._get(self.pool_for(key), [key]).get(key)
+
+    def get_many(self, keys):
+        """Return a dictionary of the values stored for keys.
+
+        Keys that are not stored are omitted. Keys are requested from each
+        server with a single command, and the servers are queried
+        concurrently.
+
+        """
+        values = {}
+        if not keys:
+            return values
+        names = dict((normalise_key(key), key) for key in keys)
+        for found in self._each_server(self.group_keys(names), self._get):
+            for key, value in found.items():
+                values[names[key]] = value
+        return values
+
+    def _get(self, pool, keys):
+        """Fetch keys from one server, returning a dictionary."""
+        values = {}
+        try:
+            with self._pool_connection(pool) as conn:
+                conn.send('get %s\r\n' % ' '.join(keys))
+                while True:
+                    line = conn.readline()
+                    if line == 'END':
+                        return values
+                    parts = line.split()
+                    if not parts or parts[0] != 'VALUE' or len(parts) < 4:
+                        raise MemcacheError("Unexpected response %r" % line)
+                    data = conn.read(int(parts[3]))
+                    values[parts[1]] = deserialise(int(parts[2]), data)
+        except MemcacheError as e:
+            logger.warning("memcached get failed: %s", e)
+            return {}
+
+    def _store(self, command, key, value, expiry):
+        """Send a storage command.
+
+        Returns True if the value was stored, False if it was not, and None
+        if the server could not be reached or gave an unexpected response.
+
+        """
+        key = normalise_key(key)
+        flags, data = serialise(value)
+        try:
+            with self._connection(key) as conn:
+                conn.send('%s %s %d %d %d\r\n%s\r\n' % (
+                    command, key, flags, expiry_time(expiry), len(data), data
+                ))
+                line = conn.readline()
+                if line not in ('STORED', 'NOT_STORED'):
+                    # Raising closes the connection, so that later commands
+                    # don't read the rest of this reply
+                    raise MemcacheError("Unexpected response %r" % line)
+        except MemcacheError as e:
+            logger.warning("memcached %s failed: %s", command, e)
+            return None
+        return line == 'STORED'
+
+    def set(self, key, value, expiry=0):
+        """Store value for key.
+
+        Returns True if it was stored, or None if the server could not be
+        reached.
+
+        """
+        return self._store('set', key, value, expiry)
+
+    def set_many(self, mapping, expiry=0):
+        """Store each of a dictionary of values.
+
+        The commands for each server are sent together, without waiting for
+        each response, and the servers are written to concurrently. Returns
+        a list of the keys that were not stored.
+
+        """
+        failed = []
+        if not mapping:
+            return failed
+        names = dict((normalise_key(key), key) for key in mapping)
+        values = dict((key, mapping[name]) for key, name in names.items())
+
+        def store(pool, keys):
+            return self._store_many(pool, keys, values, expiry)
+        for keys in self._each_server(self.group_keys(names), store):
+            failed.extend(names[key] for key in keys)
+        return failed
+
+    def _store_many(self, pool, keys, mapping, expiry):
+        """Pipeline set commands to one server; return the keys not stored."""
+        commands = []
+        for key in keys:
+            flags, data = serialise(mapping[key])
+            commands.append('set %s %d %d %d\r\n%s\r\n' % (
+                key, flags, expiry_time(expiry), len(data), data
+            ))
+        try:
+            with self._pool_connection(pool) as conn:
+                conn.send(''.join(commands))
+                lines = [conn.readline() for key in keys]
+                for line in lines:
+                    if line not in ('STORED', 'NOT_STORED'):
+                        raise MemcacheError("Unexpected response %r" % line)
+        except MemcacheError as e:
+            logger.warning("memcached set failed: %s", e)
+            return keys
+        return [key for key, line in zip(keys, lines) if line != 'STORED']
+
+    def add(self, key, value, expiry=0):
+        """Store value only if key is not already stored.
+
+        Returns True if it was stored, False if key is already stored, or
+        None if the server could not be reached.
+
+        """
+        return self._store('add', key, value, expiry)
+
+    def delete(self, key):
+        """Remove key. Returns True if it was stored."""
+        key = normalise_key(key)
+        try:
+            with self._connection(key) as conn:
+                conn.send('delete %s\r\n' % key)
+                line = conn.readline()
+                if line not in ('DELETED', 'NOT_FOUND'):
+                    raise MemcacheError("Unexpected response %r" % line)
+        except MemcacheError as e:
+            logger.warning("memcached delete failed: %s", e)
+            return False
+        return line == 'DELETED'
+
+    def incr(self, key, delta=1):
+        """Increment the integer stored for key.
+
+        Returns the new value, or None if key is not stored.
+
+        """
+        key = normalise_key(key)
+        try:
+            with self._connection(key) as conn:
+                conn.send('incr %s %d\r\n' % (key, delta))
+                line = conn.readline()
+                if not line.isdigit() and line != 'NOT_FOUND':
+                    raise MemcacheError("Unexpected response %r" % line)
+        except MemcacheError as e:
+            logger.warning("memcached incr failed: %s", e)
+            return None
+        if line.isdigit():
+            return int(line)
+        return None
@@ -0,0 +1,50 @@
+"""Running independent calls concurrently within a request.
+
+A view that makes several independent database queries one after another
+waits for each round-trip in turn. parallel() runs them in separate
+greenlets instead, so that the view waits roughly as long as the slowest::
+
+    from nucleon.parallel import parallel
+
+    def dashboard(request):
+        users, orders, stock = parallel(
+            count_users, recent_orders, lambda: stock_levels(limit=10)
+        )
+        ...
+
+"""
+
+import gevent
+from gevent.pool import Pool
+
+from .deadlines import propagate
+
+
+__all__ = ['parallel']
+
+
+def parallel(*funcs, **kwargs):
+    """Call each of funcs concurrently, and return their results in order.
+
+    Each function is called with no arguments, in its own greenlet. If limit
+    is given, at most that many are run at once; note that queries made in
+    parallel also wait for a connection from the database's pool.
+
+    If any function raises an exception, the others are killed and the
+    first exception is raised. Any deadline in effect applies to each call.
+
+    """
+    limit = kwargs.pop('limit', None)
+    if kwargs:
+        raise TypeError(
+            "Unexpected keyword arguments: %s" % ', '.join(sorted(kwargs))
+        )
+    pool = Pool(limit)
+    greenlets = []
+    try:
+        for func in funcs:
+            greenlets.append(pool.spawn(propagate(func)))
+        gevent.joinall(greenlets, raise_error=True)
+    finally:
+        gevent.killall(greenlets)
+    return [g.value for g in greenlets]
@@ -0,0 +1,301 @@
+"""Resolution of request paths to the routes registered with an application.
+
+Routes are indexed in a radix tree keyed on the literal prefix of each
+pattern, so that only routes whose prefix matches a request path are
+considered for it. The candidate routes at each node of the tree are merged
+into as few alternation regular expressions as possible, so that resolving a
+path costs a walk down the tree and, typically, a single regex match.
+
+Routes are always tried in the order they were added; the first route whose
+pattern matches the path wins.
+
+Patterns may contain typed placeholders such as ``<int:id>``, which are
+compiled into groups whose captured strings are converted before they are
+passed to the view. If conversion fails the route is treated as not matching
+and the following routes are tried.
+
+"""
+
+import re
+import uuid
+import sre_parse
+import sre_constants
+
+
+__all__ = ['Router', 'add_converter']
+
+# Python 2's re module supports at most 100 groups per pattern
+MAX_GROUPS = 99
+
+# Constructs that depend on group numbering or set flags for the whole
+# pattern; patterns using these cannot be merged into an alternation.
+UNMERGEABLE_RE = re.compile(r'\\\d|\(\?P=|\(\?\(|\(\?[iLmsux]+\)')
+
+# Typed placeholders, <type:name> or <name>, but not named groups (?P<name>
+PLACEHOLDER_RE = re.compile(r'(?<!\?P)<(?:(\w+):)?(\w+)>')
+
+# Placeholder types, mapping to (regex, conversion function). Conversion
+# functions raise ValueError if a value cannot be converted.
+CONVERTERS = {
+    'str': (r'[^/]+', None),
+    'path': (r'.+', None),
+    'int': (r'\d+', int),
+    'float': (r'\d+(?:\.\d+)?', float),
+    'uuid': (r'[0-9a-fA-F-]{32,36}', uuid.UUID),
+}
+
+
+def add_converter(name, regex, convert):
+    """Register a placeholder type for use in URL patterns.
+
+    regex is the pattern matched by the placeholder; it must not contain
+    capturing groups. convert is called with the matched string and should
+    return the converted value, or raise ValueError if it is not valid.
+
+    """
+    CONVERTERS[name] = (regex, convert)
+
+
+def compile_pattern(pattern):
+    """Compile a URL pattern that may contain typed placeholders.
+
+    Returns a tuple (regex, converters) where converters is a tuple giving
+    the conversion function (or None) for each group in regex, or None if
+    no groups require conversion.
+
+    """
+    placeholders = []
+
+    def replace(mo):
+        type = mo.group(1) or 'str'
+        try:
+            regex, convert = CONVERTERS[type]
+        except KeyError:
+            raise ValueError("Unknown placeholder type %r in pattern %r" % (type, pattern))
+        placeholders.append(convert)
+        return '(?P<_placeholder%d>%s)' % (len(placeholders) - 1, regex)
+
+    source = PLACEHOLDER_RE.sub(replace, pattern)
+    regex = re.compile('^%s$' % source)
+    if not any(placeholders):
+        converters = None
+    else:
+        converters = [None] * regex.groups
+        for i, convert in enumerate(placeholders):
+            converters[regex.groupindex['_placeholder%d' % i] - 1] = convert
+        converters = tuple(converters)
+    if placeholders:
+        # Drop the names, which were only needed to number the groups
+        source = re.sub(r'\(\?P<_placeholder\d+>', '(', source)
+        regex = re.compile('^%s$' % source)
+    return regex, converters
+
+
+def convert_args(converters, args):
+    """Apply conversion functions to the groups captured by a route."""
+    return tuple([
+        a if c is None or a is None else c(a)
+        for c, a in zip(converters, args)
+    ])
+
+
+def literal_prefix(regex):
+    """Return the literal string that any match of regex must start with.
+
+    regex is a compiled pattern, anchored at the start. An empty string is
+    returned if no such prefix can be determined.
+
+    """
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    if parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE:
+        return ''
+    prefix = []
+    for op, av in parsed:
+        if op == sre_constants.AT and av == sre_constants.AT_BEGINNING:
+            if not prefix:
+                continue
+        if op != sre_constants.LITERAL or av > 127:
+            break
+        prefix.append(chr(av))
+    return ''.join(prefix)
+
+
+def is_mergeable(regex):
+    """Return True if regex can be combined into an alternation."""
+    return not regex.groupindex and not UNMERGEABLE_RE.search(regex.pattern)
+
+
+class Matcher(object):
+    """Matches a path against an ordered list of candidate routes.
+
+    Consecutive routes are merged into combined alternation patterns, each
+    alternative wrapped in a group so that the route that matched can be
+    identified from the match's lastindex.
+
+    """
+    def __init__(self, routes):
+        """Build a matcher for routes, a list of (index, regex, converters)."""
+        self.segments = []
+        pending = []
+        for route in routes:
+            regex = route[1]
+            if not is_mergeable(regex) or regex.groups >= MAX_GROUPS:
+                self._flush(pending)
+                self.segments.append((regex, [route], None))
+                continue
+            ngroups = sum(r[1].groups + 1 for r in pending)
+            if ngroups + regex.groups + 1 > MAX_GROUPS:
+                self._flush(pending)
+            pending.append(route)
+        self._flush(pending)
+
+    def _flush(self, pending):
+        """Add the routes in pending as a single segment."""
+        if len(pending) == 1:
+            self.segments.append((pending[0][1], list(pending), None))
+        elif pending:
+            alternatives = {}
+            parts = []
+            group = 1
+            for pos, (index, regex, converters) in enumerate(pending):
+                alternatives[group] = (pos, group, group + regex.groups)
+                parts.append('(%s)' % regex.pattern)
+                group += regex.groups + 1
+            flags = pending[0][1].flags
+            combined = re.compile('|'.join(parts), flags)
+            self.segments.append((combined, list(pending), alternatives))
+        del pending[:]
+
+    def match(self, path):
+        """Return (index, args) for the first route matching path.
+
+        Return None if no route matches.
+
+        """
+        for regex, routes, alternatives in self.segments:
+            match = regex.match(path)
+            if match is None:
+                continue
+            if alternatives is None:
+                pos = 0
+                args = match.groups()
+            else:
+                pos, start, end = alternatives[match.lastindex]
+                args = match.groups()[start:end]
+            index, regex, converters = routes[pos]
+            if converters is None:
+                return index, args
+            try:
+                return index, convert_args(converters, args)
+            except ValueError:
+                pass
+
+            # Conversion failed; try the rest of the segment one at a time
+            for index, regex, converters in routes[pos + 1:]:
+                match = regex.match(path)
+                if match is None:
+                    continue
+                if converters is None:
+                    return index, match.groups()
+                try:
+                    return index, convert_args(converters, match.groups())
+                except ValueError:
+                    pass
+        return None
+
+
+class RadixNode(object):
+    """A node in the radix tree of route prefixes."""
+    def __init__(self):
+        self.edges = {}   # first character -> (label, child node)
+        self.routes = []  # routes whose prefix ends here
+        self.matcher = None
+
+    def insert(self, prefix, route):
+        """Insert route under the given literal prefix."""
+        if not prefix:
+            self.routes.append(route)
+            return
+        try:
+            label, child = self.edges[prefix[0]]
+        except KeyError:
+            child = RadixNode()
+            self.edges[prefix[0]] = (prefix, child)
+            child.routes.append(route)
+            return
+
+        common = 0
+        limit = min(len(label), len(prefix))
+        while common < limit and label[common] == prefix[common]:
+            common += 1
+
+        if common < len(label):
+            # Split the edge at the end of the common prefix
+            split = RadixNode()
+            split.edges[label[common]] = (label[common:], child)
+            self.edges[prefix[0]] = (label[:common], split)
+            child = split
+        child.insert(prefix[common:], route)
+
+    def compile(self, inherited=()):
+        """Build matchers for this node and its descendants.
+
+        inherited is the list of routes from ancestor nodes, which are also
+        candidates for any path that reaches this node.
+
+        """
+        candidates = sorted(list(inherited) + self.routes, key=lambda r: r[0])
+        self.matcher = Matcher(candidates)
+        for label, child in self.edges.values():
+            child.compile(candidates)
+
+
+class Router(object):
+    """An index of URL patterns that resolves paths to matching routes."""
+    def __init__(self):
+        self.root = RadixNode()
+        self.size = 0
+        self.compiled = False
+
+    def add(self, pattern):
+        """Add a pattern to the index.
+
+        Returns a tuple (index, regex) where index is the position of the
+        pattern in the order in which patterns are tried and regex is the
+        compiled pattern.
+
+        """
+        regex, converters = compile_pattern(pattern)
+        index = self.size
+        self.root.insert(literal_prefix(regex), (index, regex, converters))
+        self.size += 1
+        self.compiled = False
+        return index, regex
+
+    def compile(self):
+        """Rebuild the matchers after patterns have been added."""
+        self.root.compile()
+        self.compiled = True
+
+    def match(self, path):
+        """Resolve path to the first matching pattern.
+
+        Returns a tuple (index, args) where args are the groups captured by
+        the pattern, converted according to any typed placeholders, or None
+        if no pattern matches.
+
+        """
+        if not self.compiled:
+            self.compile()
+        node = self.root
+        pos = 0
+        while True:
+            try:
+                label, child = node.edges[path[pos]]
+            except (KeyError, IndexError):
+                break
+            if not path.startswith(label, pos):
+                break
+            node = child
+            pos += len(label)
+        return node.matcher.match(path)
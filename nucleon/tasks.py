@@ -0,0 +1,115 @@
+"""Work deferred until after a response has been served.
+
+Each worker process has a TaskQueue, which runs deferred calls in a small,
+fixed number of greenlets. The queue is bounded; what happens when it is full
+is decided by its overflow policy:
+
+``block``
+    The caller waits until there is room in the queue.
+
+``drop``
+    The call is discarded and counted in the queue's stats.
+
+``run``
+    The call is made immediately, in the caller's greenlet.
+
+"""
+
+import logging
+
+import gevent
+from gevent.queue import JoinableQueue, Full
+
+
+__all__ = ['TaskQueue']
+
+OVERFLOW_POLICIES = ('block', 'drop', 'run')
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue(object):
+    """A bounded queue of calls, run by a pool of worker greenlets."""
+
+    def __init__(self, workers=4, size=1000, overflow='block'):
+        """Create a queue.
+
+        At most size calls may be waiting, and workers calls are run at once.
+        overflow is the policy applied when the queue is full, one of
+        OVERFLOW_POLICIES.
+
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy %r" % overflow)
+        self.workers = workers
+        self.size = size
+        self.overflow = overflow
+        self.queue = JoinableQueue(size)
+        self.greenlets = []
+        self.dropped = 0
+        self.failed = 0
+
+    def defer(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) in a worker greenlet.
+
+        Returns True if the call was queued or made, or False if it was
+        dropped because the queue is full.
+
+        """
+        if not self.greenlets:
+            # Workers are only started when needed, so that none are started
+            # before worker processes are forked
+            self.greenlets = [
+                gevent.spawn(self._work) for i in xrange(self.workers)
+            ]
+        task = (func, args, kwargs)
+        if self.overflow == 'block':
+            self.queue.put(task)
+            return True
+        try:
+            self.queue.put_nowait(task)
+        except Full:
+            if self.overflow == 'drop':
+                self.dropped += 1
+                logger.warning("Task queue full; dropped %r", func)
+                return False
+            self._run(task)
+        return True
+
+    def _work(self):
+        """Run calls from the queue, forever."""
+        while True:
+            task = self.queue.get()
+            try:
+                self._run(task)
+            finally:
+                self.queue.task_done()
+
+    def _run(self, task):
+        """Make a call, logging any exception it raises."""
+        func, args, kwargs = task
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            self.failed += 1
+            logger.exception("Error in deferred call to %r", func)
+
+    def join(self, timeout=None):
+        """Wait until every queued call has finished.
+
+        Returns False if calls are still pending after timeout seconds.
+
+        """
+        # JoinableQueue.join() only accepts a timeout from gevent 1.1
+        with gevent.Timeout(timeout, False):
+            self.queue.join()
+            return True
+        return False
+
+    def stats(self):
+        """Return a dictionary describing the state of the queue."""
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
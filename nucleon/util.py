@@ -1,5 +1,27 @@
 from gevent.event import AsyncResult
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    from ordereddict import OrderedDict
+
+
+class cached_property(object):
+    """
+    A property that is computed when first read, and stored on the instance.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
 
 class WaitCounter(object):
     """
@@ -50,3 +72,96 @@ class WaitCounter(object):
     def __exit__(self, typ, val, tb):
         self.dec()
 
+
+
+class CountedIterable(object):
+    """
+    Wraps a WSGI app_iter so that a WaitCounter is held until it is closed.
+
+    This allows responses whose body is produced after the view returns to
+    be counted as in progress until the body has been sent.
+    """
+
+    def __init__(self, counter, iterable):
+        self.counter = counter
+        self.iterable = iterable
+        self.closed = False
+        counter.inc()
+
+    def __iter__(self):
+        try:
+            for chunk in self.iterable:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.counter.dec()
+
+
+class LRUCache(object):
+    """A mapping of bounded size that discards the least recently used items.
+
+    Counts of hits and misses are kept so that the effectiveness of the cache
+    can be monitored.
+
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def __str__(self):
+        return '<%s size=%s/%s hits=%s misses=%s>' % (self.__class__.__name__, len(self._items), self.size, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return the value for key, marking it as most recently used."""
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Store value for key, discarding the least recently used item if
+        the cache is full."""
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.size:
+            self._items.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        self._items.pop(key, None)
+
+    def clear(self):
+        """Remove all items from the cache."""
+        self._items.clear()
+
+    def stats(self):
+        """Return a dictionary of statistics about the cache."""
+        return {
+            'size': len(self._items),
+            'max_size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
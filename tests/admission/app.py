@@ -0,0 +1,25 @@
+import gevent
+from nucleon.framework import Application
+app = Application(max_active_requests=2)
+
+# Names of the views called, in order
+calls = []
+
+
+@app.view('/slow')
+def slow(request):
+    calls.append('slow')
+    gevent.sleep(0.1)
+    return {'slow': True}
+
+
+@app.view('/fast')
+def fast(request):
+    calls.append('fast')
+    return {'fast': True}
+
+
+@app.view('/raw', raw=True)
+def raw(request):
+    calls.append('raw')
+    return {'raw': True}
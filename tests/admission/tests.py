@@ -0,0 +1,20 @@
+import gevent
+from nose.tools import eq_
+from nucleon import tests
+app = tests.get_test_app(__file__)
+
+
+def test_max_active_requests():
+    """Test that requests beyond max_active_requests get a fast 503."""
+    from app import calls
+    slow_requests = [gevent.spawn(app.get, '/slow') for i in range(2)]
+    gevent.sleep(0.01)
+    resp = app.get('/fast', status=503)
+    eq_(resp.json['error'], 'SERVICE_UNAVAILABLE')
+    eq_(resp.headers['Retry-After'], '1')
+    app.get('/raw', status=503)
+    eq_(app.app.shed_requests, 2)
+    eq_(calls, ['slow', 'slow'])
+
+    gevent.joinall(slow_requests)
+    eq_(app.get('/fast').json, {'fast': True})
@@ -0,0 +1,51 @@
+import gevent
+from nucleon.http import Http404, JsonErrorResponse
+from nucleon.framework import Application
+app = Application()
+
+
+@app.view('/fail')
+def fail(request):
+    raise IOError("Let's imagine something failed here.")
+
+
+@app.view('/404')
+def missing(request):
+    raise Http404("This thing didn't exist")
+
+
+@app.view('/400')
+def client_error(request):
+    return JsonErrorResponse({
+        'error': 'SOME_ERROR',
+        'message': 'Some message'
+    })
+
+
+@app.view('/items/<int:id>')
+def item(request, id):
+    return {
+        'id': id,
+        'q': request.GET.get('q'),
+        'agent': request.headers.get('User-Agent'),
+    }
+
+
+@app.view('/raw/<int:id>', raw=True)
+def raw(request, id):
+    return {'id': id, 'agent': request.headers.get('User-Agent')}
+
+
+@app.view('/slow')
+def slow(request):
+    gevent.sleep(0.05)
+    return {}
+
+
+def echo(request):
+    return {'body': request.body}
+
+
+app.add_view('/echo', {'POST': echo}, raw=True)
+
+app.add_batch_view('/batch', concurrency=2, max_requests=6)
@@ -0,0 +1,51 @@
+import json
+from nose.tools import eq_
+from nucleon import tests
+app = tests.get_test_app(__file__)
+
+
+def test_batch():
+    """Test that a batch of sub-requests is served in one response."""
+    resp = app.post('/batch', json.dumps([
+        '/400',
+        {'path': '/items/5?q=1', 'headers': {'User-Agent': 'batch'}},
+        {'path': '/echo', 'method': 'POST', 'body': {'a': 1}},
+        '/404',
+        '/fail',
+        '/raw/6',
+    ]), headers={'User-Agent': 'client'})
+    eq_(resp.content_type, 'application/json')
+    eq_([r['status'] for r in resp.json], [400, 200, 200, 404, 500, 200])
+    eq_(resp.json[0]['body'], app.get('/400', status=400).json)
+    eq_(resp.json[1]['body']['q'], '1')
+    eq_(resp.json[1]['body']['agent'], 'batch')
+    eq_(json.loads(resp.json[2]['body']['body']), {'a': 1})
+    assert 'IOError' in resp.json[4]['body']
+    # Headers are inherited from the batch request
+    eq_(resp.json[5]['body']['agent'], 'client')
+
+
+def test_batch_invalid():
+    """Test that invalid batches are refused."""
+    app.post('/batch', 'not json', status=400)
+    app.post('/batch', '{"path": "/"}', status=400)
+    app.post('/batch', '[{"method": "GET"}]', status=400)
+    app.post('/batch', json.dumps(['/400'] * 7), status=400)
+    resp = app.post('/batch', '[{"path": "/400", "headers": "x"}]', status=400)
+    eq_(resp.json['error'], 'INVALID_BATCH')
+    resp = app.post('/batch', json.dumps([
+        {'method': 'POST', 'path': '/batch', 'body': []}
+    ]))
+    eq_(resp.json[0]['status'], 400)
+    eq_(resp.json[0]['body']['error'], 'INVALID_BATCH')
+
+
+def test_batch_admission():
+    """Test that each sub-request is subject to max_active_requests."""
+    app.app.max_active_requests = 2
+    try:
+        resp = app.post('/batch', json.dumps(['/slow', '/slow']))
+    finally:
+        app.app.max_active_requests = None
+    eq_([r['status'] for r in resp.json], [200, 503])
+    eq_(app.app.active_requests_counter.counter, 0)
@@ -0,0 +1,18 @@
+import gevent
+from nucleon.framework import Application
+app = Application()
+
+
+@app.view('/slow', max_concurrency=1, queue=1)
+def slow(request):
+    gevent.sleep(0.05)
+    return {}
+
+
+@app.view('/fast')
+def fast(request):
+    return {}
+
+
+# Adding a pattern again must not replace the limit already in use
+app.add_view('/slow', slow, max_concurrency=1, queue=1)
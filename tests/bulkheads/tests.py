@@ -0,0 +1,30 @@
+import gevent
+from nose.tools import eq_, assert_raises
+from nucleon import tests
+app = tests.get_test_app(__file__)
+
+
+def test_route_concurrency():
+    """Test that a route's concurrency limit and queue are enforced."""
+    running = [gevent.spawn(app.get, '/slow') for i in range(2)]
+    gevent.sleep(0.01)
+    stats = app.app.stats()['routes']['/slow']
+    eq_(stats['active'], 1)
+    eq_(stats['waiting'], 1)
+
+    app.get('/slow', status=503)
+    app.get('/fast', status=200)
+    gevent.joinall(running)
+    eq_([g.value.status_int for g in running], [200, 200])
+
+    stats = app.app.stats()['routes']['/slow']
+    eq_(stats['active'], 0)
+    eq_(stats['rejected'], 1)
+
+
+def test_conflicting_bulkhead():
+    """Test that a pattern cannot be given two different limits."""
+    assert_raises(
+        ValueError, app.app.add_view, '/slow', {'POST': lambda r: {}},
+        max_concurrency=2
+    )
@@ -0,0 +1,45 @@
+from nucleon.framework import Application
+from nucleon.cache import cached
+app = Application()
+
+# Number of times each view has been called
+calls = {}
+
+
+def count(name):
+    calls[name] = calls.get(name, 0) + 1
+    return calls[name]
+
+
+@app.view('/remote/(\d+)')
+@cached(expiry=60)
+def remote(request, id):
+    return {'id': id, 'calls': count('remote')}
+
+
+@app.view('/local/(\d+)')
+@cached(expiry=60, local_ttl=0.1)
+def local(request, id):
+    return {'id': id, 'calls': count('local')}
+
+
+@app.view('/slow/(\d+)')
+@cached(expiry=60)
+def slow(request, id):
+    import gevent
+    gevent.sleep(0.05)
+    return {'id': id, 'calls': count('slow')}
+
+
+@app.view('/stale/(\d+)')
+@cached(expiry=1, stale=60)
+def stale(request, id):
+    import gevent
+    gevent.sleep(0.05)
+    return {'id': id, 'calls': count('stale')}
+
+
+@app.view('/tagged/(\d+)')
+@cached(expiry=600, tags=lambda request, id: ['user:%s' % id, 'users'])
+def tagged(request, id):
+    return {'id': id, 'calls': count('tagged')}
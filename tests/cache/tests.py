@@ -0,0 +1,352 @@
+import time
+import uuid
+from nose.tools import eq_
+from nucleon import tests
+from nucleon import cache
+from nucleon.cache import LocalCache
+app = tests.get_test_app(__file__)
+
+
+def unique_id():
+    """Return a number that has not been used as a cache key before."""
+    return uuid.uuid4().int % 10 ** 12
+
+
+def test_cached():
+    """Test that a cached view is only called once."""
+    id = unique_id()
+    first = app.get('/remote/%d' % id).json
+    eq_(app.get('/remote/%d' % id).json, first)
+
+
+def test_local_cache_hits():
+    """Test that values with a local_ttl are served from process memory."""
+    id = unique_id()
+    before = cache.stats()
+    first = app.get('/local/%d' % id).json
+    eq_(app.get('/local/%d' % id).json, first)
+    after = cache.stats()
+    eq_(after['local']['hits'] - before['local']['hits'], 1)
+    eq_(after['memcached']['hits'], before['memcached']['hits'])
+
+
+def test_local_cache_expiry():
+    """Test that values expire from the local cache, but not memcached."""
+    id = unique_id()
+    first = app.get('/local/%d' % id).json
+    time.sleep(0.15)
+    before = cache.stats()
+    eq_(app.get('/local/%d' % id).json, first)
+    eq_(cache.stats()['memcached']['hits'] - before['memcached']['hits'], 1)
+
+
+def test_local_cache_budget():
+    """Test that the local cache evicts least recently used values."""
+    local = LocalCache(max_bytes=10)
+    local.set('a', 'xxxx', 60)
+    local.set('b', 'xxxx', 60)
+    local.get('a')
+    local.set('c', 'xxxx', 60)
+    eq_(local.get('b'), None)
+    eq_(local.get('a'), 'xxxx')
+    eq_(local.get('c'), 'xxxx')
+    eq_(local.stats()['bytes'], 8)
+
+
+def test_local_cache_too_big():
+    """Test that values larger than the budget are not stored."""
+    local = LocalCache(max_bytes=10)
+    local.set('a', 'x' * 11, 60)
+    eq_(len(local), 0)
+
+
+def test_coalesced():
+    """Test that concurrent misses for the same key call the view once."""
+    import gevent
+    from app import calls
+    id = unique_id()
+    before = calls.get('slow', 0)
+    requests = [gevent.spawn(app.get, '/slow/%d' % id) for i in range(5)]
+    gevent.joinall(requests)
+    eq_(calls['slow'] - before, 1)
+    eq_(len(set(r.value.body for r in requests)), 1)
+
+
+def test_coalesced_errors():
+    """Test that waiting callers receive the error of the computation."""
+    import gevent
+
+    def fail():
+        gevent.sleep(0.02)
+        raise ValueError("failed")
+
+    key = 'error:%d' % unique_id()
+    callers = [gevent.spawn(cache.fetch, key, fail) for i in range(3)]
+    gevent.joinall(callers)
+    eq_([type(c.exception) for c in callers], [ValueError] * 3)
+
+
+def test_lock():
+    """Test that a value is awaited while another process holds the lock."""
+    import gevent
+    key = 'locked:%d' % unique_id()
+    cache.cache.add(cache.LOCK_PREFIX + key, 1, 5)
+    caller = gevent.spawn(cache.fetch, key, lambda: 'computed', lock_timeout=5)
+    gevent.sleep(0.1)
+    cache.cache.set(key, 'stored', 60)
+    eq_(caller.get(timeout=1), 'stored')
+
+
+def test_lock_timeout():
+    """Test that the value is computed if the lock is not released."""
+    key = 'stuck:%d' % unique_id()
+    cache.cache.add(cache.LOCK_PREFIX + key, 1, 5)
+    eq_(cache.fetch(key, lambda: 'computed', lock_timeout=0.1), 'computed')
+
+
+def test_stale_while_revalidate():
+    """Test that stale responses are served while they are refreshed."""
+    import gevent
+    from app import calls
+    id = unique_id()
+    first = app.get('/stale/%d' % id).json
+    time.sleep(1.1)
+
+    # The stale response is served without waiting for the view
+    start = time.time()
+    eq_(app.get('/stale/%d' % id).json, first)
+    assert time.time() - start < 0.05
+    gevent.sleep(0.1)
+    refreshed = app.get('/stale/%d' % id).json
+    eq_(refreshed['calls'], first['calls'] + 1)
+
+
+def test_early_refresh():
+    """Test that values are refreshed before they expire."""
+    import gevent
+    key = 'early:%d' % unique_id()
+    values = iter(['first', 'second'])
+
+    def compute():
+        gevent.sleep(0.01)
+        return next(values)
+
+    eq_(cache.fetch(key, compute, expiry=60, early_refresh=1e6), 'first')
+    # Given a very large early_refresh, the value is refreshed at once
+    eq_(cache.fetch(key, compute, expiry=60, early_refresh=1e6), 'first')
+    gevent.sleep(0.05)
+    eq_(cache.fetch(key, compute, expiry=60, early_refresh=1e6), 'second')
+
+
+def test_no_early_refresh():
+    """Test that values are not refreshed early without early_refresh."""
+    key = 'late:%d' % unique_id()
+    values = iter(['first', 'second'])
+    eq_(cache.fetch(key, lambda: next(values), expiry=60, stale=60), 'first')
+    eq_(cache.fetch(key, lambda: next(values), expiry=60, stale=60), 'first')
+    time.sleep(0.05)
+    eq_(cache.fetch(key, lambda: next(values), expiry=60, stale=60), 'first')
+
+
+def test_response_record():
+    """Test that responses survive encoding as a cache record."""
+    from webob import Response
+    resp = Response('{"a": 1}', status=201, content_type='application/json')
+    resp.headers['ETag'] = '"abc"'
+    resp.set_cookie('session', 'secret')
+    decoded = cache.decode_response(cache.encode_response(resp))
+    eq_(decoded.status_int, 201)
+    eq_(decoded.body, '{"a": 1}')
+    eq_(decoded.content_type, 'application/json')
+    eq_(decoded.headers['ETag'], '"abc"')
+    assert 'Set-Cookie' not in decoded.headers
+
+
+def test_compressed_record():
+    """Test that large bodies can be compressed in records."""
+    from webob import Response
+    resp = Response('x' * 10000, content_type='text/plain')
+    record = cache.encode_response(resp, compress=True)
+    assert len(record) < 1000
+    eq_(cache.decode_response(record).body, 'x' * 10000)
+
+
+def test_unknown_record():
+    """Test that records in an unknown format are not decoded."""
+    from webob import Response
+    record = cache.encode_response(Response('x'))
+    eq_(cache.decode_response(chr(cache.RECORD_VERSION + 1) + record[1:]), None)
+    eq_(cache.decode_response('x'), None)
+
+
+def test_parse_servers():
+    """Test that server lists are parsed from settings."""
+    from nucleon.memcached import parse_servers
+    eq_(parse_servers('10.0.0.1, 10.0.0.2:11212:3'), [
+        (('10.0.0.1', 11211), 1),
+        (('10.0.0.2', 11212), 3),
+    ])
+
+
+def test_ring_remapping():
+    """Test that adding a server moves only a fraction of keys."""
+    from nucleon.memcached import Ring
+    servers = [(('10.0.0.%d' % i, 11211), 1) for i in range(1, 5)]
+    before = Ring(servers)
+    after = Ring(servers + [(('10.0.0.5', 11211), 1)])
+    keys = ['key:%d' % i for i in range(2000)]
+    moved = [k for k in keys if before.get(k) != after.get(k)]
+    assert 0 < len(moved) < len(keys) * 0.35, len(moved)
+    for k in moved:
+        eq_(after.get(k), ('10.0.0.5', 11211))
+
+
+def test_ring_weights():
+    """Test that servers with greater weight are given more keys."""
+    from nucleon.memcached import Ring
+    ring = Ring([(('10.0.0.1', 11211), 1), (('10.0.0.2', 11211), 3)])
+    keys = ['key:%d' % i for i in range(2000)]
+    heavy = sum(1 for k in keys if ring.get(k) == ('10.0.0.2', 11211))
+    assert 0.65 < heavy / 2000.0 < 0.85, heavy
+
+
+def test_dead_server():
+    """Test that a server that cannot be reached is skipped for a while."""
+    from nucleon.memcached import MemcacheClient
+    client = MemcacheClient([(('127.0.0.1', 1), 1)])
+    eq_(client.get('key'), None)
+    eq_(client.set('key', 'value'), None)
+    pool = client.pool_for('key')
+    assert pool.dead_until > time.time()
+    pool._connect = None  # would fail if a connection were attempted
+    eq_(client.get('key'), None)
+
+
+def test_get_many():
+    """Test that several values can be stored and fetched at once."""
+    prefix = 'many:%d:' % unique_id()
+    values = dict((prefix + str(i), i) for i in range(10))
+    eq_(cache.set_many(values, 60), [])
+    keys = values.keys() + [prefix + 'missing']
+    eq_(cache.get_many(keys), values)
+
+
+def test_get_many_local():
+    """Test that get_many() serves keys from the in-process cache."""
+    prefix = 'many:%d:' % unique_id()
+    cache.set_many({prefix + 'a': 'a', prefix + 'b': 'b'}, 60, local_ttl=10)
+    before = cache.stats()
+    eq_(cache.get_many([prefix + 'a', prefix + 'b'], local_ttl=10),
+        {prefix + 'a': 'a', prefix + 'b': 'b'})
+    eq_(cache.stats()['local']['hits'] - before['local']['hits'], 2)
+
+
+def test_fetch_many():
+    """Test that only missing values are loaded, in a single call."""
+    prefix = 'entity:%d:' % unique_id()
+    loads = []
+
+    def load(ids):
+        loads.append(sorted(ids))
+        return dict((id, {'id': id}) for id in ids if id != 4)
+
+    def key(id):
+        return prefix + str(id)
+
+    eq_(cache.fetch_many([1, 2], load, key), {1: {'id': 1}, 2: {'id': 2}})
+    eq_(cache.fetch_many([1, 2, 3, 4], load, key),
+        {1: {'id': 1}, 2: {'id': 2}, 3: {'id': 3}})
+    eq_(loads, [[1, 2], [3, 4]])
+
+
+def test_get_many_dead_server():
+    """Test that keys on a server that cannot be reached are omitted."""
+    from nucleon.memcached import MemcacheClient
+    client = MemcacheClient([
+        (('127.0.0.1', 11211), 1), (('127.0.0.1', 1), 1)
+    ])
+    keys = ['node:%d:%d' % (unique_id(), i) for i in range(20)]
+    failed = client.set_many(dict((k, k) for k in keys), 60)
+    live = [k for k in keys if client.ring.get(k)[1] == 11211]
+    eq_(sorted(failed), sorted(set(keys) - set(live)))
+    eq_(client.get_many(keys), dict((k, k) for k in live))
+
+
+def test_invalidate_tag():
+    """Test that invalidating a tag invalidates responses tagged with it."""
+    id = unique_id()
+    first = app.get('/tagged/%d' % id).json
+    eq_(app.get('/tagged/%d' % id).json, first)
+    cache.invalidate('user:%d' % id)
+    second = app.get('/tagged/%d' % id).json
+    assert second['calls'] > first['calls']
+    eq_(app.get('/tagged/%d' % id).json, second)
+
+
+def test_invalidate_shared_tag():
+    """Test that a tag shared by several responses invalidates them all."""
+    ids = [unique_id(), unique_id()]
+    first = [app.get('/tagged/%d' % id).json for id in ids]
+    cache.invalidate('user:%d' % unique_id())
+    eq_([app.get('/tagged/%d' % id).json for id in ids], first)
+    cache.invalidate('users')
+    for id, resp in zip(ids, first):
+        assert app.get('/tagged/%d' % id).json['calls'] > resp['calls']
+
+
+def test_evicted_generation():
+    """Test that a tag's generation never goes back after eviction."""
+    tag = 'evicted:%d' % unique_id()
+    [first] = cache.generations([tag])
+    cache.invalidate(tag)
+    eq_(cache.generations([tag]), [first + 1])
+    cache.cache.remote.delete(cache.GENERATION_PREFIX + tag)
+    [second] = cache.generations([tag])
+    assert second > first + 1
+
+
+def test_long_key():
+    """Test that responses for long paths are cached."""
+    path = '/remote/%d' % unique_id()
+    path += '0' * (300 - len(path))
+    first = app.get(path).json
+    eq_(app.get(path).json, first)
+    eq_(app.get('/remote/%d' % unique_id()).status_int, 200)
+
+
+def test_invalid_key_chars():
+    """Test that keys containing spaces or control characters are usable."""
+    key = 'key with spaces\r\n%d' % unique_id()
+    assert cache.cache.set(key, 'value', 60)
+    eq_(cache.cache.get(key), 'value')
+    eq_(cache.get_many([key]), {key: 'value'})
+
+
+def test_lock_dead_server():
+    """Test that a lock is not waited for if memcached is unreachable."""
+    from nucleon.memcached import MemcacheClient
+    remote = cache.cache.remote
+    cache.cache._remote = MemcacheClient([(('127.0.0.1', 1), 1)])
+    try:
+        start = time.time()
+        eq_(cache.fetch('locked', lambda: 'value', lock_timeout=2), 'value')
+        assert time.time() - start < 1
+    finally:
+        cache.cache._remote = remote
+
+
+def test_coalesce_none():
+    """Test that concurrent misses are coalesced when the value is None."""
+    import gevent
+    key = 'none:%d' % unique_id()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        gevent.sleep(0.05)
+        return None
+
+    fetches = [gevent.spawn(cache.fetch, key, compute) for i in range(3)]
+    gevent.joinall(fetches, raise_error=True)
+    eq_([g.value for g in fetches], [None] * 3)
+    eq_(len(calls), 1)
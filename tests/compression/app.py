@@ -0,0 +1,37 @@
+from nucleon.framework import Application
+from nucleon.http import JsonResponse
+app = Application(compress_min_size=256, etags=True)
+
+calls = []
+
+
+@app.view('/small')
+def small(request):
+    return {'size': 'small'}
+
+
+@app.view('/large')
+def large(request):
+    return {'items': range(500)}
+
+
+@app.view('/stream')
+def stream(request):
+    for i in xrange(500):
+        yield {'id': i}
+
+
+@app.view('/memoized', memoize_body=True)
+def memoized(request):
+    calls.append(1)
+    return {'items': range(500)}
+
+
+@app.view('/vary')
+def vary(request):
+    return JsonResponse({'items': range(500)}, vary=['Cookie'])
+
+
+@app.view('/tagged', etag=lambda request: 'v1')
+def tagged(request):
+    return {'items': range(500)}
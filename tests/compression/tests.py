@@ -0,0 +1,152 @@
+import zlib
+import json
+from nose.tools import eq_
+from webob import Request
+from nucleon import tests
+app = tests.get_test_app(__file__)
+
+GZIP = {'Accept-Encoding': 'gzip, deflate'}
+
+
+def get(path, headers={}, status=200):
+    """Make a request without WebTest, which decodes compressed bodies."""
+    resp = Request.blank(path, headers=headers).get_response(app.app)
+    eq_(resp.status_int, status)
+    return resp
+
+
+def gunzip(body):
+    return zlib.decompress(body, zlib.MAX_WBITS | 16)
+
+
+def test_small_not_compressed():
+    """Test that bodies under the minimum size are not compressed."""
+    resp = get('/small', headers=GZIP)
+    eq_(resp.headers.get('Content-Encoding'), None)
+    eq_(resp.headers.get('Vary'), None)
+    eq_(json.loads(resp.body), {'size': 'small'})
+
+
+def test_gzip():
+    """Test that large bodies are compressed with gzip."""
+    resp = get('/large', headers=GZIP)
+    eq_(resp.headers['Content-Encoding'], 'gzip')
+    eq_(resp.headers['Vary'], 'Accept-Encoding')
+    eq_(int(resp.headers['Content-Length']), len(resp.body))
+    eq_(json.loads(gunzip(resp.body)), {'items': range(500)})
+
+
+def test_deflate():
+    """Test that deflate is used if gzip is not acceptable."""
+    resp = get('/large', headers={'Accept-Encoding': 'gzip;q=0, deflate'})
+    eq_(resp.headers['Content-Encoding'], 'deflate')
+    eq_(json.loads(zlib.decompress(resp.body)), {'items': range(500)})
+
+
+def test_not_accepted():
+    """Test that bodies are not compressed for clients that don't accept it."""
+    resp = get('/large')
+    eq_(resp.headers.get('Content-Encoding'), None)
+    eq_(resp.headers['Vary'], 'Accept-Encoding')
+    eq_(json.loads(resp.body), {'items': range(500)})
+
+
+def test_existing_vary():
+    """Test that Accept-Encoding is added to an existing Vary header."""
+    resp = get('/vary', headers=GZIP)
+    eq_(resp.headers['Vary'], 'Cookie, Accept-Encoding')
+
+
+def test_stream():
+    """Test that streamed responses are compressed."""
+    resp = get('/stream', headers=GZIP)
+    eq_(resp.headers['Content-Encoding'], 'gzip')
+    eq_(len(json.loads(gunzip(resp.body))), 500)
+
+
+def test_stream_incremental():
+    """Test that each chunk of a streamed response is flushed."""
+    req = Request.blank('/stream', headers=GZIP)
+    status, headers, app_iter = req.call_application(app.app)
+    d = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    chunks = iter(app_iter)
+    try:
+        first = d.decompress(next(chunks))
+        assert first.startswith('[{"id": 0}')
+    finally:
+        app_iter.close()
+    eq_(app.app.active_requests_counter.counter, 0)
+
+
+def test_weak_etag():
+    """Test that compressed responses have weak ETags which still match."""
+    resp = get('/large', headers=GZIP)
+    etag = resp.headers['ETag']
+    assert etag.startswith('W/')
+    headers = dict(GZIP, **{'If-None-Match': etag})
+    get('/large', headers=headers, status=304)
+
+
+def test_head():
+    """Test that HEAD responses have the headers GET would be sent with."""
+    resp = get('/large', headers=GZIP)
+    head = Request.blank('/large', headers=GZIP, method='HEAD').get_response(
+        app.app
+    )
+    eq_(head.body, '')
+    for header in ('Content-Encoding', 'Content-Length', 'Vary', 'ETag'):
+        eq_(head.headers.get(header), resp.headers[header])
+
+
+def test_not_modified_headers():
+    """Test that a 304 repeats the ETag and Vary of the full response."""
+    for path in ('/large', '/tagged'):
+        for headers in (GZIP, {}):
+            resp = get(path, headers=headers)
+            headers = dict(headers, **{'If-None-Match': resp.headers['ETag']})
+            not_mod = get(path, headers=headers, status=304)
+            eq_(not_mod.headers['ETag'], resp.headers['ETag'])
+            eq_(not_mod.headers['Vary'], 'Accept-Encoding')
+
+    resp = get('/small', headers=GZIP)
+    headers = dict(GZIP, **{'If-None-Match': resp.headers['ETag']})
+    not_mod = get('/small', headers=headers, status=304)
+    eq_(not_mod.headers['ETag'], resp.headers['ETag'])
+    eq_(not_mod.headers.get('Vary'), None)
+
+
+def test_memoized_etag():
+    """Test that memoized responses keep the same ETag when compressed."""
+    first = get('/memoized', headers=GZIP).headers['ETag']
+    second = get('/memoized', headers=GZIP).headers['ETag']
+    eq_(second, first)
+    eq_(get('/memoized').headers['ETag'], first[2:])
+    headers = dict(GZIP, **{'If-None-Match': first})
+    get('/memoized', headers=headers, status=304)
+
+
+def test_memoized():
+    """Test that memoized responses are stored compressed."""
+    from app import calls
+    first = get('/memoized', headers=GZIP)
+    second = get('/memoized', headers=GZIP)
+    eq_(second.headers['Content-Encoding'], 'gzip')
+    eq_(second.body, first.body)
+    eq_(app.get('/memoized').json, {'items': range(500)})
+    eq_(len(calls), 1)
+
+
+def test_accepted_encoding():
+    """Test choosing an encoding from Accept-Encoding."""
+    from nucleon.compression import accepted_encoding
+
+    def choose(header):
+        return accepted_encoding(Request.blank('/', headers={
+            'Accept-Encoding': header
+        }))
+    eq_(choose('gzip'), 'gzip')
+    eq_(choose('deflate, gzip;q=0.5'), 'deflate')
+    eq_(choose('*'), 'gzip')
+    eq_(choose('*;q=0'), None)
+    eq_(choose('br'), None)
+    eq_(choose('identity'), None)
@@ -5,6 +5,8 @@ from nose.tools import eq_, raises, with_setup
 from nucleon import tests
 from nucleon.database import IntegrityError
 from nucleon.database.api import NoResults, MultipleResults
+from nucleon.database.pgpool import PostgresConnectionPool
+from nucleon.deadlines import DeadlineExceeded, deadline
 import gevent
 from gevent.pool import Group
 from gevent.coros import Semaphore
@@ -200,3 +202,64 @@ def test_auto_rollback():
     names = select_names().flat
     assert 'five' not in names
     assert 'seven' not in names
+
+
+def test_deadline_statement_timeout():
+    """Test that queries within a deadline are given a statement_timeout."""
+    with deadline(5):
+        timeout = db.query('SHOW statement_timeout').value
+    assert timeout != '0', timeout
+    eq_(db.query('SHOW statement_timeout').value, '0')
+
+
+@raises(DeadlineExceeded)
+def test_deadline_cancels_query():
+    """Test that a query still running at the deadline is cancelled."""
+    try:
+        with deadline(0.2):
+            db.query('SELECT pg_sleep(5)')
+    finally:
+        # The connection is still usable afterwards
+        eq_(db.query('SELECT 1').value, 1)
+
+
+def test_deadline_releases_connections():
+    """Test that queries interrupted by a deadline return their connection."""
+    pool = PostgresConnectionPool.for_url(db.get_pool().url, limit=2)
+    for i in range(3):
+        try:
+            with deadline(0.1):
+                with pool.cursor() as c:
+                    c.execute('SELECT pg_sleep(5)')
+        except DeadlineExceeded:
+            pass
+        else:
+            assert False, "Query was not interrupted"
+
+    # The pool has not leaked any slots
+    with gevent.Timeout(5):
+        with pool.cursor() as c:
+            c.execute('SELECT 1')
+            eq_(c.fetchone()[0], 1)
+
+
+def test_query_error_not_cancelled():
+    """Test that errors reported by the server don't cancel the query."""
+    from nucleon.database.psyco_gevent import gevent_wait_callback
+    from psycopg2 import ProgrammingError
+    cancels = []
+
+    class FailedConnection(object):
+        def poll(self):
+            raise ProgrammingError('syntax error')
+
+        def cancel(self):
+            cancels.append(self)
+
+    try:
+        gevent_wait_callback(FailedConnection())
+    except ProgrammingError:
+        pass
+    else:
+        raise AssertionError("ProgrammingError not raised")
+    eq_(cancels, [])
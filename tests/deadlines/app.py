@@ -0,0 +1,34 @@
+import gevent
+from nucleon.framework import Application
+from nucleon.deadlines import remaining
+app = Application(deadline=0.2)
+
+# Time remaining when each view with a route deadline was called
+budgets = []
+
+
+@app.view('/slow')
+def slow(request):
+    gevent.sleep(1)
+    return {}
+
+
+def route_slow(request):
+    budgets.append(remaining())
+    gevent.sleep(1)
+    return {}
+
+
+app.add_view('/route-slow', route_slow, deadline=0.05)
+app.add_view('/raw-slow', route_slow, deadline=0.05, raw=True)
+
+
+@app.view('/long', deadline=1)
+def long_view(request):
+    gevent.sleep(0.3)
+    return {'remaining': remaining()}
+
+
+@app.view('/budget')
+def budget(request):
+    return {'remaining': remaining()}
@@ -0,0 +1,28 @@
+import time
+from nose.tools import eq_
+from nucleon import tests
+from nucleon.deadlines import remaining
+app = tests.get_test_app(__file__)
+
+
+def test_route_deadline():
+    """Test that a view that overruns its route's deadline is interrupted."""
+    from app import budgets
+    start = time.time()
+    resp = app.get('/route-slow', status=503)
+    eq_(resp.json['message'], 'Deadline exceeded')
+    app.get('/raw-slow', status=503)
+    assert time.time() - start < 0.3
+    assert all(0 < b <= 0.05 for b in budgets)
+
+
+def test_route_deadline_overrides_app():
+    """Test that a route's deadline replaces the application's."""
+    assert app.get('/long').json['remaining'] > 0.2
+
+
+def test_app_deadline():
+    """Test that the application's deadline applies to every view."""
+    app.get('/slow', status=503)
+    assert 0 < app.get('/budget').json['remaining'] <= 0.2
+    eq_(remaining(), None)
@@ -1,5 +1,6 @@
 from nucleon.http import Http404, JsonErrorResponse
 from nucleon.framework import Application
+from nucleon.signals import Signal
 app = Application()
 
 
@@ -31,3 +32,69 @@ def client_error(request):
         'error': 'SOME_ERROR',
         'message': 'Some message'
     })
+
+
+# Views with memoized responses
+
+calls = {'constant': 0, 'expiring': 0}
+on_change = Signal()
+
+
+@app.view('/constant', memoize_body=True, invalidate_on=on_change)
+def constant(request):
+    calls['constant'] += 1
+    return {'calls': calls['constant']}
+
+
+@app.view('/expiring/(\d+)', memoize_body=0.05)
+def expiring(request, id):
+    calls['expiring'] += 1
+    return {'id': id, 'calls': calls['expiring']}
+
+
+# Views with ETags
+
+
+@app.view('/etag/(\d+)', etag=lambda request, rev: 'rev' + rev)
+def etag(request, rev):
+    return {'rev': rev}
+
+
+# Views served without webob
+
+
+@app.view('/raw/<int:id>', raw=True)
+def raw(request, id):
+    return {
+        'id': id,
+        'q': request.GET.get('q'),
+        'agent': request.headers.get('User-Agent'),
+        'request': type(request).__name__,
+    }
+
+
+@app.view('/raw-missing', raw=True)
+def raw_missing(request):
+    raise Http404("Not here")
+
+
+@app.view('/raw-response', raw=True)
+def raw_response(request):
+    return JsonErrorResponse({'error': 'RAW'})
+
+
+def raw_post(request):
+    return {'body': request.body}
+
+
+app.add_view('/raw-post', {'POST': raw_post}, raw=True)
+
+
+@app.view('/raw-unserialisable', raw=True)
+def raw_unserialisable(request):
+    return {'value': object()}
+
+
+@app.view('/raw-stream', raw=True)
+def raw_stream(request):
+    return ({'n': n} for n in range(3))
@@ -1,6 +1,7 @@
 # coding: utf8
 import sys
 import re
+import json
 import urllib
 from nose.tools import eq_
 from cStringIO import StringIO
@@ -59,7 +60,7 @@ def test_post_view_defaults_to_utf8():
 def test_post_to_get_only_view():
     """Test that posting to a GET-only view yields a 405 response."""
     resp = app.post('/', status=405)
-    eq_(resp.headers['Allow'], 'GET')
+    eq_(resp.headers['Allow'], 'GET, HEAD, OPTIONS')
     eq_(resp.body, '')
 
 
@@ -67,7 +68,43 @@ def test_get_post_only_view():
     """Test that getting a POST-only view yields a 405 response."""
     resp = app.get('/post', status=405)
     allowed_methods = set(re.split(r',\s*', resp.headers['Allow']))
-    eq_(allowed_methods, set(['POST', 'PUT']))
+    eq_(allowed_methods, set(['POST', 'PUT', 'OPTIONS']))
+    eq_(resp.body, '')
+
+
+def test_head_get_view():
+    """Test that HEAD requests are served by the GET view, without a body."""
+    get = app.get('/constant')
+    resp = app.head('/constant', status=200)
+    eq_(resp.headers['Content-Type'], get.headers['Content-Type'])
+    eq_(resp.headers['Content-Length'], str(len(get.body)))
+    eq_(resp.body, '')
+
+
+def test_head_error():
+    """Test that HEAD requests report the errors the GET view gives."""
+    resp = app.head('/404', status=404)
+    eq_(resp.body, '')
+
+
+def test_head_raw_view():
+    """Test that HEAD requests to raw views are sent without a body."""
+    get = app.get('/raw/5')
+    resp = app.head('/raw/5', status=200)
+    eq_(resp.headers['Content-Length'], str(len(get.body)))
+    eq_(resp.body, '')
+
+
+def test_head_post_only_view():
+    """Test that HEAD requests to a view without GET yield a 405."""
+    app.head('/post', status=405)
+
+
+def test_options():
+    """Test that OPTIONS requests are answered with the allowed methods."""
+    resp = app.options('/post', status=200)
+    allowed_methods = set(re.split(r',\s*', resp.headers['Allow']))
+    eq_(allowed_methods, set(['POST', 'PUT', 'OPTIONS']))
     eq_(resp.body, '')
 
 
@@ -90,3 +127,152 @@ def test_400():
         'error': 'SOME_ERROR',
         'message': 'Some message'
     })
+
+
+# Tests for memoized views
+
+
+def test_memoized_view():
+    """Test that a memoized view is called once and its response reused."""
+    from app import on_change
+    first = app.get('/constant')
+    second = app.get('/constant')
+    eq_(second.json, first.json)
+    eq_(second.headers['Content-Type'], 'application/json')
+    on_change.fire()
+    eq_(app.get('/constant').json['calls'], first.json['calls'] + 1)
+
+
+def test_memoized_view_arguments():
+    """Test that responses are memoized separately for each URL."""
+    first = app.get('/expiring/1').json
+    eq_(app.get('/expiring/2').json['id'], '2')
+    eq_(app.get('/expiring/1').json, first)
+
+
+def test_memoized_view_expiry():
+    """Test that memoized responses expire after their TTL."""
+    import gevent
+    first = app.get('/expiring/3').json
+    gevent.sleep(0.1)
+    assert app.get('/expiring/3').json['calls'] > first['calls']
+
+
+# Tests for conditional GET
+
+
+def make_etag_app():
+    """Build an app that adds ETags to its responses."""
+    from webtest import TestApp
+    from nucleon.framework import Application
+    etag_app = Application(etags=True)
+    calls = []
+
+    def thing(request, id):
+        calls.append(id)
+        return {'id': id}
+
+    etag_app.add_view('/things/(\d+)', thing)
+    etag_app.add_view('/versioned/(\d+)', thing, etag=lambda request, id: 'v' + id)
+    return TestApp(etag_app), calls
+
+
+def test_etag():
+    """Test that responses are tagged with a strong ETag of their body."""
+    testapp, calls = make_etag_app()
+    resp = testapp.get('/things/1')
+    assert resp.etag
+    eq_(testapp.get('/things/1').etag, resp.etag)
+    assert testapp.get('/things/2').etag != resp.etag
+
+
+def test_if_none_match():
+    """Test that a matching If-None-Match gives an empty 304."""
+    testapp, calls = make_etag_app()
+    etag = testapp.get('/things/1').headers['ETag']
+    resp = testapp.get('/things/1', headers={'If-None-Match': etag}, status=304)
+    eq_(resp.body, '')
+    eq_(resp.headers['ETag'], etag)
+    assert 'Content-Type' not in resp.headers
+    testapp.get('/things/2', headers={'If-None-Match': etag}, status=200)
+
+
+def test_head_etag():
+    """Test that HEAD responses have the ETag of GET and can be conditional."""
+    testapp, calls = make_etag_app()
+    etag = testapp.get('/things/1').headers['ETag']
+    eq_(testapp.head('/things/1').headers['ETag'], etag)
+    resp = testapp.head('/things/1', headers={'If-None-Match': etag}, status=304)
+    eq_(resp.headers['ETag'], etag)
+    assert 'Content-Type' not in resp.headers
+
+
+def test_etag_hook():
+    """Test that an ETag function can avoid calling the view."""
+    testapp, calls = make_etag_app()
+    resp = testapp.get('/versioned/5')
+    eq_(resp.etag, 'v5')
+    eq_(calls, ['5'])
+    testapp.get('/versioned/5', headers={'If-None-Match': '"v5"'}, status=304)
+    eq_(calls, ['5'])
+
+
+def test_etag_hook_without_app_etags():
+    """Test that ETag functions work when the app does not compute ETags."""
+    resp = app.get('/etag/3')
+    eq_(resp.etag, 'rev3')
+    app.get('/etag/3', headers={'If-None-Match': '"rev3"'}, status=304)
+    assert 'ETag' not in app.get('/400', status=400).headers
+
+
+# Tests for raw views
+
+
+def test_raw_view():
+    """Test that raw views receive a RawRequest and return JSON."""
+    resp = app.get('/raw/5?q=foo', headers={'User-Agent': 'tests'})
+    eq_(resp.content_type, 'application/json')
+    eq_(resp.json, {
+        'id': 5, 'q': 'foo', 'agent': 'tests', 'request': 'RawRequest'
+    })
+
+
+def test_raw_view_exception():
+    """Test that HTTP exceptions raised in raw views give error responses."""
+    resp = app.get('/raw-missing', status=404)
+    eq_(resp.json['error'], 'NOT_FOUND')
+
+
+def test_raw_view_response():
+    """Test that raw views can return Response objects."""
+    resp = app.get('/raw-response', status=400)
+    eq_(resp.json, {'error': 'RAW'})
+
+
+def test_raw_view_methods():
+    """Test method handling for raw views."""
+    eq_(app.post('/raw-post', 'hello').json, {'body': 'hello'})
+    resp = app.get('/raw-post', status=405)
+    eq_(resp.headers['Allow'], 'OPTIONS, POST')
+
+
+def test_raw_view_unserialisable():
+    """Test that raw views returning unserialisable values give a 500."""
+    buf = StringIO()
+    with stderr(buf):
+        app.get('/raw-unserialisable', status=500)
+    assert 'TypeError' in buf.getvalue()
+
+
+def test_raw_view_stream():
+    """Test that raw views returning iterators are streamed."""
+    resp = app.get('/raw-stream')
+    eq_(resp.json, [{'n': 0}, {'n': 1}, {'n': 2}])
+
+
+def test_raw_view_rejects_memoize():
+    """Test that raw views cannot be memoized."""
+    from nose.tools import assert_raises
+    from nucleon.framework import Application
+    assert_raises(TypeError, Application().add_view,
+        '/', lambda request: {}, raw=True, memoize_body=True)
@@ -1,5 +1,6 @@
 import datetime
 from nucleon.framework import Application
+from nucleon.http import Http404, StreamingJsonResponse
 
 app = Application()
 
@@ -85,3 +86,26 @@ def dates_bst(request):
         'datetime': some_instant,
         'time': some_instant.timetz()
     }
+
+
+@app.view('/stream')
+def stream(request):
+    """Stream a large number of rows as a JSON array."""
+    for i in xrange(1000):
+        yield {'id': i, 'date': datetime.date(2012, 2, 21)}
+
+
+@app.view('/stream-empty')
+def stream_empty(request):
+    return iter([])
+
+
+@app.view('/stream-ndjson')
+def stream_ndjson(request):
+    return StreamingJsonResponse(({'id': i} for i in xrange(3)), ndjson=True)
+
+
+@app.view('/stream-missing')
+def stream_missing(request):
+    raise Http404("Nothing to stream")
+    yield
@@ -1,5 +1,6 @@
 from nucleon import tests
-from nose.tools import eq_
+from nose.tools import eq_, raises
+from nucleon.config import ConfigurationError
 app = tests.get_test_app(__file__)
 
 
@@ -46,3 +47,90 @@ def test_dates_bst():
         'date': '2012-02-21',
         'time': '11:57:11+01:00'
     })
+
+
+def test_stream():
+    """Test that views returning generators are streamed as a JSON array."""
+    resp = app.get('/stream')
+    eq_(resp.content_type, 'application/json')
+    eq_(len(resp.json), 1000)
+    eq_(resp.json[999], {'id': 999, 'date': '2012-02-21'})
+
+
+def test_stream_empty():
+    """Test streaming an empty iterator."""
+    eq_(app.get('/stream-empty').json, [])
+
+
+def test_stream_ndjson():
+    """Test streaming newline-delimited JSON."""
+    resp = app.get('/stream-ndjson')
+    eq_(resp.content_type, 'application/x-ndjson')
+    eq_(resp.body, '{"id": 0}\n{"id": 1}\n{"id": 2}\n')
+
+
+def test_stream_error():
+    """Test that errors raised before the first object give an error response."""
+    resp = app.get('/stream-missing', status=404)
+    eq_(resp.json['error'], 'NOT_FOUND')
+
+
+def test_stream_is_incremental():
+    """Test that objects are serialised as the response is written."""
+    from nucleon.http import StreamingJsonResponse
+    produced = []
+
+    def rows():
+        for i in xrange(100000):
+            produced.append(i)
+            yield {'id': i}
+
+    resp = StreamingJsonResponse(rows())
+    chunks = iter(resp.app_iter)
+    first = next(chunks)
+    assert first.startswith('[{"id": 0}')
+    assert len(produced) < 100000
+
+
+def test_stream_not_length_delimited():
+    """Test that streamed responses are sent without a Content-Length."""
+    from webob import Request
+    status, headers, app_iter = Request.blank('/stream').call_application(app.app)
+    try:
+        eq_(status, '200 OK')
+        assert 'content-length' not in [h.lower() for h, v in headers]
+        # The request is in progress until the body has been sent
+        eq_(app.app.active_requests_counter.counter, 1)
+    finally:
+        app_iter.close()
+    eq_(app.app.active_requests_counter.counter, 0)
+
+
+def test_encoders_agree():
+    """Test that all JSON encoders serialise dates in the same way."""
+    import datetime
+    from nucleon.json_encoders import ENCODERS, load_encoder
+    obj = {'datetime': datetime.datetime(2012, 2, 21, 11, 57, 11, 451137)}
+    for name in ENCODERS:
+        eq_(load_encoder(name)(obj), '{"datetime": "2012-02-21T11:57:11"}')
+
+
+@raises(ConfigurationError)
+def test_unknown_encoder():
+    """Test that selecting an unknown JSON encoder is an error."""
+    from nucleon.json_encoders import load_encoder
+    load_encoder('nonexistent')
+
+
+def test_encoder_fallback():
+    """Test that an encoder that cannot be imported falls back to json."""
+    from nucleon.json_encoders import register_encoder, load_encoder, ENCODERS
+
+    def missing():
+        import nonexistent_json_module
+
+    register_encoder('missing', missing)
+    try:
+        eq_(load_encoder('missing')({'a': 1}), '{"a": 1}')
+    finally:
+        del ENCODERS['missing']
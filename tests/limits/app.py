@@ -0,0 +1,26 @@
+import gevent
+from nucleon.framework import Application
+from nucleon.limits import GradientLimit
+app = Application(limiter=GradientLimit(initial=1, max_limit=1))
+
+
+@app.view('/slow')
+def slow(request):
+    gevent.sleep(0.05)
+    return {}
+
+
+# An app serving a mix of cheap memoized hits and views that do real work
+mixed = Application(limiter=GradientLimit(initial=20))
+
+
+@mixed.view('/memoized', memoize_body=True)
+def memoized(request):
+    gevent.sleep(0.005)
+    return {}
+
+
+@mixed.view('/work')
+def work(request):
+    gevent.sleep(0.005)
+    return {}
@@ -0,0 +1,72 @@
+import gevent
+from nose.tools import eq_
+from webtest import TestApp
+from nucleon import tests
+from nucleon.limits import GradientLimit
+from app import mixed
+app = tests.get_test_app(__file__)
+
+
+def test_gradient_limit_grows():
+    """Test that an adaptive limit grows while latency is steady."""
+    limit = GradientLimit(initial=10)
+    for i in range(50):
+        limit.record(0.01, active=10)
+    assert limit.limit > 20
+
+
+def test_gradient_limit_shrinks():
+    """Test that an adaptive limit shrinks when latency rises."""
+    limit = GradientLimit(initial=100)
+    for i in range(10):
+        limit.record(0.01, active=100)
+    before = limit.limit
+    for i in range(50):
+        limit.record(0.1, active=100)
+    assert limit.limit < before / 2
+    assert limit.allows(int(limit.limit))
+    assert not limit.allows(int(limit.limit) + 1)
+
+
+def test_gradient_limit_idle():
+    """Test that an adaptive limit doesn't grow while it is not used."""
+    limit = GradientLimit(initial=10)
+    for i in range(50):
+        limit.record(0.01, active=1)
+    eq_(limit.limit, 10)
+
+
+def test_gradient_limit_window():
+    """Test that a fast outlier is forgotten after two windows."""
+    limit = GradientLimit(initial=100, window=10)
+    limit.record(0.0001, active=100)
+    for i in range(19):
+        limit.record(0.01, active=100)
+    eq_(limit.min_latency, 0.01)
+    before = limit.limit
+    for i in range(20):
+        limit.record(0.01, active=100)
+    assert limit.limit > before
+
+
+def test_mixed_latency():
+    """Test that memoized hits don't hold down the limit for other views."""
+    mixed_app = TestApp(mixed)
+    for i in range(100):
+        mixed_app.get('/memoized' if i % 10 < 3 else '/work')
+    limiter = mixed.stats()['limiter']
+    assert limiter['min_latency'] >= 0.005
+    assert limiter['limit'] >= 20
+
+
+def test_adaptive_limit_sheds():
+    """Test that requests beyond an adaptive limit are refused."""
+    first = gevent.spawn(app.get, '/slow')
+    gevent.sleep(0.01)
+    app.get('/slow', status=503)
+    first.join()
+
+    stats = app.app.stats()
+    eq_(stats['shed_requests'], 1)
+    eq_(stats['limiter']['limit'], 1)
+    assert stats['limiter']['latency'] >= 0.05
@@ -0,0 +1,16 @@
+import time
+import gevent
+from nucleon.framework import Application
+from nucleon.parallel import parallel
+app = Application(deadline=1)
+
+
+def sleeper(t):
+    return lambda: gevent.sleep(t) or t
+
+
+@app.view('/fanout')
+def fanout(request):
+    start = time.time()
+    results = parallel(sleeper(0.05), sleeper(0.01), sleeper(0.03))
+    return {'results': results, 'elapsed': time.time() - start}
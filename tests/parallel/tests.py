@@ -0,0 +1,57 @@
+import time
+import gevent
+from nose.tools import eq_
+from nucleon import tests
+from nucleon.parallel import parallel
+from nucleon.deadlines import deadline, remaining
+app = tests.get_test_app(__file__)
+
+
+def test_parallel():
+    """Test that parallel() runs calls concurrently and keeps their order."""
+    resp = app.get('/fanout').json
+    eq_(resp['results'], [0.05, 0.01, 0.03])
+    assert resp['elapsed'] < 0.09
+
+
+def test_parallel_limit():
+    """Test that parallel() runs at most limit calls at once."""
+    running = []
+
+    def call():
+        running.append(None)
+        peak = len(running)
+        gevent.sleep(0.01)
+        running.pop()
+        return peak
+
+    assert max(parallel(*[call] * 6, limit=2)) == 2
+
+
+def test_parallel_error():
+    """Test that parallel() raises the first error and kills the others."""
+    finished = []
+
+    def fail():
+        gevent.sleep(0.01)
+        raise ValueError("failed")
+
+    def slow():
+        gevent.sleep(0.1)
+        finished.append(True)
+
+    try:
+        parallel(slow, fail, slow)
+    except ValueError as e:
+        eq_(e.args, ("failed",))
+    else:
+        raise AssertionError("ValueError not raised")
+    gevent.sleep(0.15)
+    eq_(finished, [])
+
+
+def test_parallel_deadline():
+    """Test that calls made by parallel() share the current deadline."""
+    with deadline(1):
+        budgets = parallel(remaining, remaining)
+    assert all(0 < b <= 1 for b in budgets)
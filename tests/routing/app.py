@@ -0,0 +1,58 @@
+from nucleon.framework import Application
+app = Application()
+
+
+@app.view('/')
+def root(request):
+    return {'view': 'root'}
+
+
+@app.view('/items/(\d+)')
+def item(request, id):
+    return {'view': 'item', 'id': id}
+
+
+@app.view('/items/(.*)')
+def item_fallback(request, rest):
+    return {'view': 'item_fallback', 'rest': rest}
+
+
+@app.view('/items/special')
+def item_special(request):
+    """Shadowed by item_fallback, which was added first."""
+    return {'view': 'item_special'}
+
+
+@app.view('/it(e)?ms-(?P<kind>\w+)')
+def items_kind(request, e, kind):
+    return {'view': 'items_kind', 'kind': kind}
+
+
+@app.view('/(?i)caseless')
+def caseless(request):
+    return {'view': 'caseless'}
+
+
+@app.view('/users/(\w+)/posts/(\d+)')
+def user_post(request, user, post):
+    return {'view': 'user_post', 'user': user, 'post': post}
+
+
+@app.view('/users/(\w+)', name='user')
+def user(request, user, name):
+    return {'view': name, 'user': user}
+
+
+@app.view('/orders/<int:id>')
+def order(request, id):
+    return {'view': 'order', 'id': id, 'type': type(id).__name__}
+
+
+@app.view('/keys/<uuid:key>/<name>')
+def key(request, key, name):
+    return {'view': 'key', 'key': str(key), 'name': name}
+
+
+@app.view('/keys/(.*)')
+def key_fallback(request, rest):
+    return {'view': 'key_fallback', 'rest': rest}
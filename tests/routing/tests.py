@@ -0,0 +1,190 @@
+from nose.tools import eq_
+from nucleon import tests
+from nucleon.routing import Router, literal_prefix
+app = tests.get_test_app(__file__)
+
+
+def test_root():
+    """Test that the root view is served."""
+    eq_(app.get('/').json, {'view': 'root'})
+
+
+def test_captured_groups():
+    """Test that groups captured in a pattern are passed to the view."""
+    eq_(app.get('/items/12').json, {'view': 'item', 'id': '12'})
+    eq_(app.get('/users/bob/posts/3').json, {
+        'view': 'user_post', 'user': 'bob', 'post': '3'
+    })
+
+
+def test_first_match_wins():
+    """Test that the first pattern added takes precedence."""
+    eq_(app.get('/items/special').json, {
+        'view': 'item_fallback', 'rest': 'special'
+    })
+
+
+def test_named_groups():
+    """Test patterns with named and optional groups."""
+    eq_(app.get('/itms-foo').json, {'view': 'items_kind', 'kind': 'foo'})
+    eq_(app.get('/items-bar').json, {'view': 'items_kind', 'kind': 'bar'})
+
+
+def test_inline_flags():
+    """Test that patterns setting global flags are matched correctly."""
+    eq_(app.get('/CaseLess').json, {'view': 'caseless'})
+
+
+def test_vars():
+    """Test that keyword parameters are passed to views."""
+    eq_(app.get('/users/alice').json, {'view': 'user', 'user': 'alice'})
+
+
+def test_404():
+    """Test that unmatched paths give a 404."""
+    app.get('/users/alice/posts/x', status=404)
+    app.get('/nothing', status=404)
+    app.get('/item', status=404)
+
+
+def test_literal_prefix():
+    """Test computing the literal prefix of patterns."""
+    import re
+    eq_(literal_prefix(re.compile('^/foo/(\d+)\.json$')), '/foo/')
+    eq_(literal_prefix(re.compile('^/fo?$')), '/f')
+    eq_(literal_prefix(re.compile('^/ab|/ac$')), '')
+    eq_(literal_prefix(re.compile('^(?i)/foo$')), '')
+
+
+def test_alternation_pattern():
+    """Test that patterns containing | keep their original meaning."""
+    r = Router()
+    r.add('/a|/b')
+    eq_(r.match('/a/anything'), (0, ()))
+    eq_(r.match('/anything/b'), (0, ()))
+    eq_(r.match('/c'), None)
+
+
+def test_many_routes():
+    """Test matching when routes exceed the number of groups in a regex."""
+    r = Router()
+    for i in range(300):
+        r.add('/route%d/(\w+)/(\d+)' % i)
+    r.add('/route(\d+)/(.*)')
+    for i in range(300):
+        eq_(r.match('/route%d/x/%d' % (i, i)), (i, ('x', str(i))))
+    eq_(r.match('/route7/x/y'), (300, ('7', 'x/y')))
+    eq_(r.match('/other'), None)
+
+
+def test_add_after_match():
+    """Test that patterns can be added after the index has been compiled."""
+    r = Router()
+    r.add('/foo/(.*)')
+    eq_(r.match('/foo/bar'), (0, ('bar',)))
+    r.add('/fo(o)')
+    eq_(r.match('/foo'), (1, ('o',)))
+    eq_(r.match('/foo/bar'), (0, ('bar',)))
+
+
+def make_cached_app(size):
+    """Build an app that caches route resolution."""
+    from webtest import TestApp
+    from nucleon.framework import Application
+    cached = Application(route_cache_size=size)
+    cached.add_view('/items/(\d+)', lambda request, id: {'id': id})
+    cached.add_view('/post', {'POST': lambda request: {'method': 'POST'}})
+    return cached, TestApp(cached)
+
+
+def test_route_cache():
+    """Test that repeated requests are resolved from the route cache."""
+    cached, testapp = make_cached_app(2)
+    eq_(testapp.get('/items/1').json, {'id': '1'})
+    eq_(testapp.get('/items/1').json, {'id': '1'})
+    eq_(cached.route_cache.hits, 1)
+    eq_(cached.route_cache.misses, 1)
+
+
+def test_route_cache_bounded():
+    """Test that the route cache does not grow beyond its size."""
+    cached, testapp = make_cached_app(2)
+    for i in range(10):
+        eq_(testapp.get('/items/%d' % i).json, {'id': str(i)})
+    eq_(len(cached.route_cache), 2)
+    eq_(cached.route_cache.misses, 10)
+
+
+def test_route_cache_errors():
+    """Test that 404 and 405 responses are unaffected by the route cache."""
+    cached, testapp = make_cached_app(2)
+    for i in range(2):
+        testapp.get('/missing', status=404)
+        resp = testapp.get('/post', status=405)
+        eq_(resp.headers['Allow'], 'OPTIONS, POST')
+    eq_(len(cached.route_cache), 0)
+    eq_(cached.route_cache.misses, 4)
+    eq_(testapp.post('/post').json, {'method': 'POST'})
+    eq_(len(cached.route_cache), 1)
+
+
+def test_lru_cache():
+    """Test that the least recently used item is discarded."""
+    from nucleon.util import LRUCache
+    c = LRUCache(2)
+    c.set('a', 1)
+    c.set('b', 2)
+    eq_(c.get('a'), 1)
+    c.set('c', 3)
+    eq_(c.get('b'), None)
+    eq_(c.get('a'), 1)
+    eq_(c.get('c'), 3)
+    eq_(c.stats(), {'size': 2, 'max_size': 2, 'hits': 3, 'misses': 1})
+
+
+def test_int_placeholder():
+    """Test that int placeholders are converted before calling the view."""
+    eq_(app.get('/orders/42').json, {'view': 'order', 'id': 42, 'type': 'int'})
+    app.get('/orders/abc', status=404)
+
+
+def test_uuid_placeholder():
+    """Test that uuid placeholders are converted before calling the view."""
+    key = '12345678-1234-5678-1234-567812345678'
+    eq_(app.get('/keys/%s/foo' % key).json, {
+        'view': 'key', 'key': key, 'name': 'foo'
+    })
+
+
+def test_failed_conversion_falls_through():
+    """Test that a value that cannot be converted tries later routes."""
+    bad = '12345678-1234-5678-1234-56781234567-'
+    eq_(app.get('/keys/%s/foo' % bad).json, {
+        'view': 'key_fallback', 'rest': bad + '/foo'
+    })
+
+
+def test_placeholders_mixed_with_groups():
+    """Test that converters line up with groups in the pattern."""
+    r = Router()
+    r.add('/(a|b)/<int:x>/(?:c)/<y>/<float:z>')
+    eq_(r.match('/a/3/c/foo/1.5'), (0, ('a', 3, 'foo', 1.5)))
+
+
+def test_custom_converter():
+    """Test registering a new placeholder type."""
+    from nucleon.routing import add_converter
+
+    def even(s):
+        if int(s) % 2:
+            raise ValueError("%s is odd" % s)
+        return int(s)
+
+    add_converter('even', r'\d+', even)
+    r = Router()
+    r.add('/n/<even:n>')
+    r.add('/n/(\d+)')
+    r.add('/m/<even:n>')
+    eq_(r.match('/n/4'), (0, (4,)))
+    eq_(r.match('/n/5'), (1, ('5',)))
+    eq_(r.match('/m/5'), None)
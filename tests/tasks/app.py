@@ -0,0 +1,18 @@
+import gevent
+from nucleon.framework import Application
+from nucleon.tasks import TaskQueue
+app = Application(tasks=TaskQueue(workers=1))
+
+# Values recorded by deferred calls, in the order the calls finished
+done = []
+
+
+def record(value, delay=0.01):
+    gevent.sleep(delay)
+    done.append(value)
+
+
+@app.view('/audited')
+def audited(request):
+    app.defer(record, 'audit')
+    return {}
@@ -0,0 +1,66 @@
+import time
+import gevent
+from nose.tools import eq_
+from nucleon import tests
+from nucleon.tasks import TaskQueue
+app = tests.get_test_app(__file__)
+
+from app import done, record
+
+
+def test_defer():
+    """Test that deferred calls run after the response has been served."""
+    del done[:]
+    app.get('/audited')
+    eq_(done, [])
+    app.app.tasks.join(1)
+    eq_(done, ['audit'])
+
+
+def test_task_queue_overflow():
+    """Test the overflow policies of a full task queue."""
+    del done[:]
+    dropping = TaskQueue(workers=1, size=1, overflow='drop')
+    dropping.defer(record, 0)
+    gevent.sleep(0)  # let the worker take the first call
+    eq_([dropping.defer(record, i) for i in (1, 2)], [True, False])
+    dropping.join()
+    eq_(done, [0, 1])
+    eq_(dropping.stats()['dropped'], 1)
+
+    del done[:]
+    running = TaskQueue(workers=1, size=1, overflow='run')
+    running.defer(record, 0)
+    gevent.sleep(0)
+    for i in (1, 2):
+        running.defer(record, i)
+    # The third call was made by the caller, before the queued call
+    assert 2 in done and 1 not in done
+    running.join()
+    eq_(sorted(done), [0, 1, 2])
+
+
+def test_task_errors():
+    """Test that errors in deferred calls are counted, not raised."""
+    tasks = TaskQueue()
+    tasks.defer(lambda: 1 / 0)
+    tasks.join()
+    eq_(tasks.stats()['failed'], 1)
+
+
+# This stops the application, so it must come last
+
+
+def test_stop_serving():
+    """Test that stop_serving() waits for queued calls, up to its timeout."""
+    del done[:]
+    for i in range(5):
+        app.app.defer(record, i)
+    app.app.stop_serving(timeout=1)
+    eq_(done, range(5))
+
+    app.app.defer(record, 'slow', 5)
+    start = time.time()
+    app.app.stop_serving(timeout=0.1)
+    assert time.time() - start < 1
+    eq_(app.app.tasks.join(0.01), False)